@@ -0,0 +1,106 @@
+import os
+import numpy as np
+import pandas as pd
+from sentiment_db import load_sentiment
+from storage import sentiment_categories
+from token_index import review_months
+
+# Columns of the sentiment results a cube is built from
+CUBE_SOURCE_COLUMNS = ['Review', 'compound', 'Rating', 'Date', 'BagOfWordsSize', 'NamedEntitiesCount']
+
+# Every cell of a cube is one combination of these, with the sums of the reviews falling in it.
+# Category splits the compound score at 0 like the overview dashboard, Label at +/-0.05 like the comparison.
+DIMENSIONS = ['Month-Year', 'Category', 'Label', 'Rating']
+FEATURES = ['compound', 'BagOfWordsSize', 'NamedEntitiesCount', 'Words']
+MEASURES = ['Reviews'] + [f"{feature}_{total}" for feature in FEATURES for total in ('sum', 'count')]
+COUNTS = ['Reviews', 'Positive', 'Neutral', 'Negative']
+
+
+def cube_path(name, directory='Sentiments'):
+    """Return the aggregate cube file of a restaurant, next to its sentiment file"""
+    return os.path.join(directory, f"{name}_cube.csv")
+
+
+def build_cube(df):
+    """Sum the review results by month, sentiment category, comparison label and rating: the number of reviews,
+    and the sum and number of values of the compound score, BoW and named entity sizes and review length in words.
+    Cells are kept in order of their first review, so months come out in the order the reviews list them."""
+    df = df.reindex(columns=CUBE_SOURCE_COLUMNS)
+    compound = df['compound'].astype(float)
+    features = {
+        'compound': compound,
+        'BagOfWordsSize': df['BagOfWordsSize'].astype(float),
+        'NamedEntitiesCount': df['NamedEntitiesCount'].astype(float),
+        'Words': pd.Series([len(review.split()) if isinstance(review, str) else np.nan for review in df['Review']],
+                           index=df.index, dtype=float),
+    }
+    cells = pd.DataFrame({
+        'Month-Year': review_months(df['Date']),
+        'Category': sentiment_categories(compound),
+        'Label': np.select([compound >= 0.05, compound <= -0.05], ['Positive', 'Negative'], default='Neutral'),
+        'Rating': df['Rating'].astype(float),
+        'Reviews': 1,
+    }, index=df.index)
+    for feature, values in features.items():
+        cells[f"{feature}_sum"] = values.fillna(0)
+        cells[f"{feature}_count"] = values.notna().astype('int64')
+    return cells.groupby(DIMENSIONS, sort=False, dropna=False)[MEASURES].sum().reset_index()
+
+
+def save_cube(cube, path):
+    temp_path = f"{path}.tmp"
+    cube.to_csv(temp_path, index=False)
+    os.replace(temp_path, path)
+    return path
+
+
+def load_cube(name, num_reviews=None, directory='Sentiments'):
+    """Load the cube of a restaurant, or None if it is missing, unreadable or does not count num_reviews reviews"""
+    try:
+        cube = pd.read_csv(cube_path(name, directory), keep_default_na=False, na_values=[''])
+    except (OSError, ValueError):
+        return None
+    if list(cube.columns) != DIMENSIONS + MEASURES:
+        return None
+    return cube if num_reviews is None or cube['Reviews'].sum() == num_reviews else None
+
+
+def restaurant_cube(name, directory='Sentiments'):
+    """Return the cube of a restaurant, built from its results if it was analyzed before cubes were written"""
+    cube = load_cube(name, directory=directory)
+    if cube is None:
+        cube = build_cube(load_sentiment(name, columns=CUBE_SOURCE_COLUMNS, directory=directory)[0])
+    return cube
+
+
+def select_cells(cube, categories=None, months=None):
+    """Keep the cells of the given sentiment categories and months (all of them if None)"""
+    mask = np.ones(len(cube), dtype=bool)
+    if categories:
+        mask &= cube['Category'].isin(categories).to_numpy()
+    if months:
+        mask &= cube['Month-Year'].isin(months).to_numpy()
+    return cube[mask]
+
+
+def rollup(cells, by=None):
+    """Sum cells by the given dimensions, sorted, or all together into one row if by is None. Returns the
+    number of reviews, of Positive (> 0), Neutral (= 0) and Negative (< 0) compound scores, and the
+    average compound score, rating, BoW and named entity sizes and review length as columns of those names."""
+    category = cells['Category']
+    totals = cells.assign(
+        Positive=cells['Reviews'].where(category == 'Positive', 0),
+        Neutral=cells['compound_count'].where(category == 'Neutral', 0),  # Reviews without a score are not Neutral
+        Negative=cells['Reviews'].where(category == 'Negative', 0),
+        Rating_sum=cells['Rating'] * cells['Reviews'],
+        Rating_count=cells['Reviews'].where(cells['Rating'].notna(), 0),
+    )
+    columns = COUNTS + [f"{feature}_{total}" for feature in FEATURES + ['Rating'] for total in ('sum', 'count')]
+    if by is None:
+        totals = totals[columns].sum().to_frame().T
+    else:
+        totals = totals.groupby(by)[columns].sum()
+    totals = totals.astype({column: 'int64' for column in COUNTS})
+    for feature in FEATURES + ['Rating']:
+        totals[feature] = totals[f"{feature}_sum"] / totals[f"{feature}_count"]
+    return totals[COUNTS + FEATURES + ['Rating']]
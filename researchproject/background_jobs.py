@@ -0,0 +1,21 @@
+import os
+import diskcache
+from dash import DiskcacheManager
+from sentiment_db import results_version
+
+# Background callbacks run in worker processes and hand their results back through this on-disk cache
+CACHE_DIRECTORY = os.environ.get('DASHBOARD_CACHE_DIR', os.path.join('Cache', 'dashboard'))
+# Word clouds and word counts the jobs share, so no job draws an image or counts reviews another job already has
+WORDCLOUD_DIRECTORY = os.path.join(CACHE_DIRECTORY, 'wordclouds')
+
+# Shown under a slow output while its job runs
+PROGRESS_VISIBLE = {'width': '100%', 'visibility': 'visible'}
+PROGRESS_HIDDEN = {'width': '100%', 'visibility': 'hidden'}
+
+
+def job_manager(directory=CACHE_DIRECTORY, expire=24 * 3600):
+    """Return the manager of the dashboards' background callbacks. Every job runs in its own process, so a slow
+    render never blocks the Flask worker, and a job still running when its inputs change is terminated.
+    Results are cached on disk by callback inputs until a restaurant is analyzed again, shared between
+    dashboard processes, and dropped once they have not been read for expire seconds."""
+    return DiskcacheManager(diskcache.Cache(directory), cache_by=[results_version], expire=expire)
@@ -4,22 +4,33 @@ from dash import dcc, html, Input, Output
 import plotly.express as px
 import plotly.graph_objects as go
 import dash_bootstrap_components as dbc
-from wordcloud import WordCloud
-import matplotlib.pyplot as plt
-import base64
-from io import BytesIO
-import os
+from background_jobs import PROGRESS_HIDDEN, PROGRESS_VISIBLE, WORDCLOUD_DIRECTORY, job_manager
+from aggregate_cube import restaurant_cube, rollup
+from frame_cache import FrameCache
+from sentiment_db import load_sentiment, restaurant_names, sentiment_version
+from token_index import load_token_index, review_months
+from wordcloud_service import WordCloudService, cell_groups, count_groups
 
 # Initialize Dash app
-app = dash.Dash(__name__, external_stylesheets=[dbc.themes.BOOTSTRAP])
+app = dash.Dash(__name__, external_stylesheets=[dbc.themes.BOOTSTRAP], background_callback_manager=job_manager())
 
-# Function to load sentiment CSV
-def load_sentiment(file):
-    df = pd.read_csv('Sentiments/' + file, skiprows=1)
+# Function to load the reviews of a restaurant with their sentiment category and month, for word clouds
+# counted without a token index. Everything else is rolled up from the restaurant's aggregate cube.
+def load_reviews(name):
+    df, _ = load_sentiment(name, columns=['Review', 'Category', 'Date'])
+    df['Month-Year'] = review_months(df['Date'])
     return df
 
-# List available sentiment CSV files
-sentiment_files = [f for f in os.listdir('Sentiments') if f.endswith('.csv')]
+# The metrics and charts of the restaurants compared so far, kept until the restaurant is re-analyzed,
+# and the word clouds and their word counts, shared by every background job
+frame_cache = FrameCache()
+wordcloud_service = WordCloudService(WORDCLOUD_DIRECTORY)
+
+# List the analyzed restaurants
+sentiment_files = restaurant_names()
+
+# Metrics that decide both the winner of a comparison and the ranking (higher is better)
+RANKING_KEYS = ['Average Rating', 'Total Reviews', '% Positive Reviews']
 
 # App Layout
 app.layout = dbc.Container([
@@ -27,21 +38,21 @@ app.layout = dbc.Container([
 
     dbc.Row([
         dbc.Col([
-            html.Label("Select First Restaurant File:"),
+            html.Label("Select First Restaurant:"),
             dcc.Dropdown(
                 id='file1',
                 options=[{'label': f, 'value': f} for f in sentiment_files],
                 value=None,
-                placeholder="Select a file..."
+                placeholder="Select a restaurant..."
             )
         ], width=6),
         dbc.Col([
-            html.Label("Select Second Restaurant File:"),
+            html.Label("Select Second Restaurant:"),
             dcc.Dropdown(
                 id='file2',
                 options=[{'label': f, 'value': f} for f in sentiment_files],
                 value=None,
-                placeholder="Select a file..."
+                placeholder="Select a restaurant..."
             )
         ], width=6),
     ], className="mb-4"),
@@ -64,18 +75,43 @@ app.layout = dbc.Container([
     ], className="mb-4"),
 
     dbc.Row([
-        dbc.Col([dcc.Graph(id='wordcloud1')], width=6),
-        dbc.Col([dcc.Graph(id='wordcloud2')], width=6),
-    ])
+        dbc.Col([dbc.Progress(id='wordcloud1_progress', style=PROGRESS_HIDDEN), dcc.Graph(id='wordcloud1')], width=6),
+        dbc.Col([dbc.Progress(id='wordcloud2_progress', style=PROGRESS_HIDDEN), dcc.Graph(id='wordcloud2')], width=6),
+    ], className="mb-4"),
+
+    # Ranking of any number of restaurants
+    html.H2("Restaurant Ranking", className="text-center my-4"),
+
+    dbc.Row([
+        dbc.Col([
+            html.Label("Select Restaurants to Rank:"),
+            dcc.Dropdown(
+                id='ranked_files',
+                options=[{'label': f, 'value': f} for f in sentiment_files],
+                value=[],
+                multi=True,
+                placeholder="Select restaurants..."
+            )
+        ], width=10),
+        dbc.Col(dbc.Button("Select All", id='select_all', color="secondary", className="mt-4"), width=2),
+    ], className="mb-4"),
+
+    dbc.Row([
+        dbc.Col([dcc.Graph(id='ranking_ratings')], width=6),
+        dbc.Col([dcc.Graph(id='ranking_sentiments')], width=6),
+    ], className="mb-4"),
+
+    dbc.Row([
+        dbc.Col(html.Div(id='ranking_table'), width=12),
+    ], className="mb-4"),
 ], fluid=True)
 
 # Helper functions
 def create_metric_table(metrics1, metrics2):
-    winning_keys = ['Average Rating', 'Total Reviews', '% Positive Reviews']  # Keys used in winner logic
     rows = []
 
     for key in metrics1.keys():
-        if key in winning_keys:
+        if key in RANKING_KEYS:
             if metrics1[key] > metrics2[key]:
                 better = '1 ⬆️'
             elif metrics2[key] > metrics1[key]:
@@ -96,12 +132,10 @@ def create_metric_table(metrics1, metrics2):
 
 
 def create_winner_card(metrics1, metrics2):
-    # Only include these metrics in winner logic
-    winning_keys = ['Average Rating', 'Total Reviews', '% Positive Reviews']
-
+    # Only the ranking metrics count in the winner logic
     score1 = 0
     score2 = 0
-    for key in winning_keys:
+    for key in RANKING_KEYS:
         if metrics1[key] > metrics2[key]:
             score1 += 1
         elif metrics2[key] > metrics1[key]:
@@ -116,17 +150,116 @@ def create_winner_card(metrics1, metrics2):
     return card
 
 
-def create_wordcloud(df):
-    text = ' '.join(df['Review'].dropna().astype(str))
-    wordcloud = WordCloud(width=400, height=300, background_color='white').generate(text)
-    fig, ax = plt.subplots(figsize=(4, 3))
-    ax.imshow(wordcloud, interpolation='bilinear')
-    ax.axis('off')
-    buf = BytesIO()
-    plt.savefig(buf, format="png")
-    plt.close(fig)
-    encoded = base64.b64encode(buf.getbuffer()).decode("utf8")
-    return f"data:image/png;base64,{encoded}"
+def restaurant_frequencies(name, version):
+    cube = cached_cube(name, version)
+    index = load_token_index(name, cube['Reviews'].sum())
+    if index is not None:
+        return index.month_frequencies()
+
+    def count_missing(groups):
+        return count_groups(load_reviews(name), groups)
+
+    return wordcloud_service.group_frequencies((name, version), cell_groups(cube), count_missing)
+
+
+def create_wordcloud(name, version):
+    return wordcloud_service.render((name, version), 400, 300, lambda: restaurant_frequencies(name, version))
+
+
+def label_counts(cube):
+    """Count the reviews of every sentiment label (compound >= 0.05, <= -0.05 or in between)"""
+    return cube.groupby('Label')['Reviews'].sum()
+
+
+def rating_counts(cube):
+    return cube.groupby('Rating')['Reviews'].sum()
+
+
+def metrics_frame(cubes):
+    """Compute the metrics of any number of restaurants at once from the concatenation of their cubes,
+    given as a dict of restaurant name to cube. Returns one row per restaurant, in the order given."""
+    names = list(cubes)
+    cells = pd.concat(cubes.values(), keys=names, names=['Restaurant', None]).reset_index(level='Restaurant')
+    totals = rollup(cells, by='Restaurant').reindex(names)
+    labels = cells.groupby(['Restaurant', 'Label'])['Reviews'].sum().unstack(fill_value=0)\
+        .reindex(index=names, columns=['Positive', 'Neutral', 'Negative'], fill_value=0)
+    shares = labels.div(labels.sum(axis=1), axis=0) * 100
+    return pd.DataFrame({
+        'Average Rating': totals['Rating'].round(2),
+        'Total Reviews': totals['Reviews'].fillna(0).astype('int64'),
+        '% Positive Reviews': shares['Positive'].round(2),
+        '% Neutral Reviews': shares['Neutral'].round(2),
+        '% Negative Reviews': shares['Negative'].round(2),
+        'Avg Review Length': totals['Words'].round(2)
+    }).rename_axis('Restaurant')
+
+
+def rank_restaurants(metrics):
+    """Rank restaurants by their average rank over the metrics of the winner logic, best first.
+    Ties share a rank, and a restaurant missing a metric ranks last on it."""
+    ranks = metrics[RANKING_KEYS].rank(ascending=False, method='min', na_option='bottom')
+    ranked = metrics.assign(**{'Average Rank': ranks.mean(axis=1).round(2)})
+    ranked.insert(0, 'Rank', ranked['Average Rank'].rank(method='min').astype('int64'))
+    return ranked.sort_values(['Rank', 'Total Reviews'], ascending=[True, False])
+
+
+def rating_histogram(ratings, title):
+    fig = px.histogram(ratings.reset_index(), x='Rating', y='Reviews', histfunc='sum', nbins=5, title=title)
+    fig.update_layout(yaxis_title='count')
+    return fig
+
+
+def sentiment_pie(labels, title):
+    return px.pie(labels.reset_index(), names='Label', values='Reviews', title=title, color='Label',
+                  color_discrete_map={'Positive': 'green', 'Neutral': 'gold', 'Negative': 'red'})
+
+
+def cached_cube(name, version):
+    """Return the aggregate cube of a restaurant, from the cache unless it was re-analyzed since"""
+    return frame_cache.get((name, 'cube'), version, lambda: restaurant_cube(name))
+
+
+def restaurant_summary(name, version):
+    """Return the label counts, rating counts and metrics of a restaurant, from the cache unless it was re-analyzed since"""
+    def load():
+        cube = cached_cube(name, version)
+        return label_counts(cube), rating_counts(cube), metrics_frame({name: cube}).to_dict('records')[0]
+    return frame_cache.get(name, version, load)
+
+
+def restaurant_figures(name, version, side):
+    """Return the rating histogram and sentiment pie of a restaurant picked on the given side, cached like its summary,
+    so changing one dropdown only redraws the charts of that side"""
+    def draw():
+        labels, ratings, _ = restaurant_summary(name, version)
+        return (rating_histogram(ratings, f'Rating Distribution - Restaurant {side}'),
+                sentiment_pie(labels, f'Sentiment Distribution - Restaurant {side}'))
+    return frame_cache.get((name, 'figures', side), version, draw)
+
+
+def difference_figures(summary1, summary2):
+    labels1, ratings1, _ = summary1
+    labels2, ratings2, _ = summary2
+
+    ratings_diff = (ratings1 - ratings2).fillna(0)
+    fig_ratings_diff = px.bar(x=ratings_diff.index, y=ratings_diff.values, title='Rating Difference (1 vs 2)')
+
+    sentiments_diff = (labels1 / labels1.sum() - labels2 / labels2.sum()).fillna(0) * 100
+    fig_sentiments_diff = px.bar(x=sentiments_diff.index, y=sentiments_diff.values, title='Sentiment % Difference (1 vs 2)',
+                                 color=sentiments_diff.index, color_discrete_map={'Positive': 'green', 'Neutral': 'gold', 'Negative': 'red'})
+    return fig_ratings_diff, fig_sentiments_diff
+
+
+def empty_figure():
+    fig = go.Figure()
+    fig.update_layout(template=None, xaxis={'visible': False}, yaxis={'visible': False})
+    return fig
+
+
+def wordcloud_figure(img):
+    fig = px.imshow([[]])
+    fig.update_layout(images=[dict(source=img, x=0, y=1, sizex=1, sizey=1, xref="paper", yref="paper")], xaxis_visible=False, yaxis_visible=False)
+    return fig
 
 
 # Callback for updates
@@ -139,78 +272,95 @@ def create_wordcloud(df):
     Output('sentiments1', 'figure'),
     Output('sentiments2', 'figure'),
     Output('sentiments_diff', 'figure'),
-    Output('wordcloud1', 'figure'),
-    Output('wordcloud2', 'figure'),
     Input('file1', 'value'),
     Input('file2', 'value')
 )
 def update_comparison(file1, file2):
-    empty_fig = go.Figure()
-    empty_fig.update_layout(template=None, xaxis={'visible': False}, yaxis={'visible': False})
+    empty_fig = empty_figure()
 
     if not file1 or not file2:
-        return "", "", empty_fig, empty_fig, empty_fig, empty_fig, empty_fig, empty_fig, empty_fig, empty_fig
-
-    df1 = load_sentiment(file1)
-    df2 = load_sentiment(file2)
-
-    # Process Sentiments
-    df1['Compound'] = df1['Sentiment'].apply(lambda x: eval(x)['compound'])
-    df2['Compound'] = df2['Sentiment'].apply(lambda x: eval(x)['compound'])
-
-    df1['Sentiment_Label'] = df1['Compound'].apply(lambda x: 'Positive' if x >= 0.05 else ('Negative' if x <= -0.05 else 'Neutral'))
-    df2['Sentiment_Label'] = df2['Compound'].apply(lambda x: 'Positive' if x >= 0.05 else ('Negative' if x <= -0.05 else 'Neutral'))
-
-    # Metrics Calculation
-    metrics1 = {
-        'Average Rating': round(df1['Rating'].mean(), 2),
-        'Total Reviews': len(df1),
-        '% Positive Reviews': round((df1['Sentiment_Label'] == 'Positive').mean() * 100, 2),
-        '% Neutral Reviews': round((df1['Sentiment_Label'] == 'Neutral').mean() * 100, 2),
-        '% Negative Reviews': round((df1['Sentiment_Label'] == 'Negative').mean() * 100, 2),
-        'Avg Review Length': round(df1['Review'].dropna().apply(lambda x: len(x.split())).mean(), 2)
-    }
-
-    metrics2 = {
-        'Average Rating': round(df2['Rating'].mean(), 2),
-        'Total Reviews': len(df2),
-        '% Positive Reviews': round((df2['Sentiment_Label'] == 'Positive').mean() * 100, 2),
-        '% Neutral Reviews': round((df2['Sentiment_Label'] == 'Neutral').mean() * 100, 2),
-        '% Negative Reviews': round((df2['Sentiment_Label'] == 'Negative').mean() * 100, 2),
-        'Avg Review Length': round(df2['Review'].dropna().apply(lambda x: len(x.split())).mean(), 2)
-    }
+        return "", "", empty_fig, empty_fig, empty_fig, empty_fig, empty_fig, empty_fig
+
+    # Label counts, rating counts and metrics of both restaurants, rolled up from their aggregate cubes
+    # (month x sentiment x label x rating) unless they are cached
+    version1, version2 = sentiment_version(file1), sentiment_version(file2)
+    summary1 = restaurant_summary(file1, version1)
+    summary2 = restaurant_summary(file2, version2)
+    metrics1, metrics2 = summary1[2], summary2[2]
 
     metric_table = create_metric_table(metrics1, metrics2)
     winner_card = create_winner_card(metrics1, metrics2)
 
-    # Rating Histograms
-    fig_ratings1 = px.histogram(df1, x='Rating', nbins=5, title='Rating Distribution - Restaurant 1')
-    fig_ratings2 = px.histogram(df2, x='Rating', nbins=5, title='Rating Distribution - Restaurant 2')
+    # Rating Histograms and Sentiment Pie Charts
+    fig_ratings1, fig_sentiments1 = restaurant_figures(file1, version1, 1)
+    fig_ratings2, fig_sentiments2 = restaurant_figures(file2, version2, 2)
 
-    ratings_diff = (df1['Rating'].value_counts().sort_index() - df2['Rating'].value_counts().sort_index()).fillna(0)
-    fig_ratings_diff = px.bar(x=ratings_diff.index, y=ratings_diff.values, title='Rating Difference (1 vs 2)')
+    # Differences, cached for the pair
+    fig_ratings_diff, fig_sentiments_diff = frame_cache.get((file1, file2, 'differences'), (version1, version2),
+                                                            lambda: difference_figures(summary1, summary2))
 
-    # Sentiment Pie Charts
-    fig_sentiments1 = px.pie(df1, names='Sentiment_Label', title='Sentiment Distribution - Restaurant 1',
-                             color='Sentiment_Label', color_discrete_map={'Positive': 'green', 'Neutral': 'gold', 'Negative': 'red'})
-    fig_sentiments2 = px.pie(df2, names='Sentiment_Label', title='Sentiment Distribution - Restaurant 2',
-                             color='Sentiment_Label', color_discrete_map={'Positive': 'green', 'Neutral': 'gold', 'Negative': 'red'})
+    return metric_table, winner_card, fig_ratings1, fig_ratings2, fig_ratings_diff, fig_sentiments1, fig_sentiments2, fig_sentiments_diff
+
+
+# Wordclouds are drawn by background jobs, one per restaurant, each showing its progress above the image
+def update_wordcloud(set_progress, name):
+    if not name:
+        return empty_figure()
+
+    set_progress((0, 1))
+    return wordcloud_figure(create_wordcloud(name, sentiment_version(name)))
+
+
+for slot in ('1', '2'):
+    app.callback(
+        Output(f'wordcloud{slot}', 'figure'),
+        Input(f'file{slot}', 'value'),
+        background=True,
+        progress=[Output(f'wordcloud{slot}_progress', 'value'), Output(f'wordcloud{slot}_progress', 'max')],
+        running=[(Output(f'wordcloud{slot}_progress', 'style'), PROGRESS_VISIBLE, PROGRESS_HIDDEN)],
+        interval=500
+    )(update_wordcloud)
 
-    sentiments_diff = (df1['Sentiment_Label'].value_counts(normalize=True) - df2['Sentiment_Label'].value_counts(normalize=True)).fillna(0) * 100
-    fig_sentiments_diff = px.bar(x=sentiments_diff.index, y=sentiments_diff.values, title='Sentiment % Difference (1 vs 2)',
-                                 color=sentiments_diff.index, color_discrete_map={'Positive': 'green', 'Neutral': 'gold', 'Negative': 'red'})
 
-    # Wordclouds
-    img1 = create_wordcloud(df1)
-    img2 = create_wordcloud(df2)
+# Ranking of the selected restaurants, from one metrics computation over all of their cubes
+def ranking_figures(ranked):
+    ranked = ranked.reset_index()
+    fig_ratings = px.bar(ranked, x='Restaurant', y='Average Rating', title='Average Rating by Rank')
+    fig_sentiments = px.bar(ranked, x='Restaurant', y=['% Positive Reviews', '% Neutral Reviews', '% Negative Reviews'],
+                            title='Sentiment Split by Rank', labels={'value': '% of Reviews', 'variable': 'Sentiment'},
+                            color_discrete_map={'% Positive Reviews': 'green', '% Neutral Reviews': 'gold', '% Negative Reviews': 'red'})
+    return fig_ratings, fig_sentiments
 
-    fig_wordcloud1 = px.imshow([[]])
-    fig_wordcloud1.update_layout(images=[dict(source=img1, x=0, y=1, sizex=1, sizey=1, xref="paper", yref="paper")], xaxis_visible=False, yaxis_visible=False)
 
-    fig_wordcloud2 = px.imshow([[]])
-    fig_wordcloud2.update_layout(images=[dict(source=img2, x=0, y=1, sizex=1, sizey=1, xref="paper", yref="paper")], xaxis_visible=False, yaxis_visible=False)
+def create_ranking_table(ranked):
+    ranked = ranked.reset_index()
+    columns = ['Rank', 'Restaurant'] + [column for column in ranked.columns if column not in ('Rank', 'Restaurant')]
+    return dbc.Table.from_dataframe(ranked[columns], bordered=True, striped=True, hover=True)
 
-    return metric_table, winner_card, fig_ratings1, fig_ratings2, fig_ratings_diff, fig_sentiments1, fig_sentiments2, fig_sentiments_diff, fig_wordcloud1, fig_wordcloud2
+
+@app.callback(
+    Output('ranking_table', 'children'),
+    Output('ranking_ratings', 'figure'),
+    Output('ranking_sentiments', 'figure'),
+    Input('ranked_files', 'value')
+)
+def update_ranking(files):
+    if not files:
+        return "", empty_figure(), empty_figure()
+
+    cubes = {name: cached_cube(name, sentiment_version(name)) for name in files}
+    ranked = rank_restaurants(metrics_frame(cubes))
+    fig_ratings, fig_sentiments = ranking_figures(ranked)
+    return create_ranking_table(ranked), fig_ratings, fig_sentiments
+
+
+@app.callback(
+    Output('ranked_files', 'value'),
+    Input('select_all', 'n_clicks'),
+    prevent_initial_call=True
+)
+def select_all_restaurants(n_clicks):
+    return sentiment_files
 
 
 if __name__ == '__main__':
@@ -0,0 +1,63 @@
+import sys
+import threading
+from collections import OrderedDict
+import pandas as pd
+
+
+def value_bytes(value):
+    """Estimate the memory used by a cached value: frames, series, objects reporting their nbytes,
+    and tuples, lists or dicts of them"""
+    if isinstance(value, pd.DataFrame):
+        return int(value.memory_usage(index=True, deep=True).sum())
+    if isinstance(value, pd.Series):
+        return int(value.memory_usage(index=True, deep=True))
+    if hasattr(value, 'nbytes'):
+        return int(value.nbytes)
+    if isinstance(value, (tuple, list)):
+        return sum(value_bytes(item) for item in value)
+    if isinstance(value, dict):
+        return sum(value_bytes(item) for item in value.values())
+    return sys.getsizeof(value)
+
+
+class FrameCache:
+    """Process-wide LRU cache of loaded and preprocessed frames, bounded by their memory use.
+    Every entry remembers the version of its source (e.g. a file mtime), and a lookup with another
+    version reloads the entry, so re-analyzed results are never served stale.
+    Cached values are shared between callers and must not be modified."""
+
+    def __init__(self, max_bytes=512 * 1024 * 1024):
+        self.max_bytes = max_bytes
+        self.entries = OrderedDict()  # source -> (version, value, size), least recently used first
+        self.total_bytes = 0
+        self.lock = threading.Lock()
+        self.hits = self.misses = 0
+
+    def get(self, source, version, load):
+        """Return the cached value of the source at the given version, calling load() to build it on a miss"""
+        with self.lock:
+            entry = self.entries.get(source)
+            if entry is not None and entry[0] == version:
+                self.entries.move_to_end(source)
+                self.hits += 1
+                return entry[1]
+            self.misses += 1
+
+        value = load()
+        size = value_bytes(value)
+        with self.lock:
+            old = self.entries.pop(source, None)
+            if old is not None:
+                self.total_bytes -= old[2]
+            self.entries[source] = (version, value, size)
+            self.total_bytes += size
+            # Evict the least recently used entries, always keeping the one just loaded
+            while self.total_bytes > self.max_bytes and len(self.entries) > 1:
+                _, (_, _, evicted_size) = self.entries.popitem(last=False)
+                self.total_bytes -= evicted_size
+        return value
+
+    def clear(self):
+        with self.lock:
+            self.entries.clear()
+            self.total_bytes = 0
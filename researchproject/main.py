@@ -1,18 +1,30 @@
 import os
+import subprocess
+import sys
 
 
 def scrape_reviews():
     """ Function to scrape reviews from the website. """
     print("Starting review scraping...")
-    # Call the zomato-review-scraper.py here
-    os.system("python zomato-review-scraper.py")
+    url_file = input("Enter a file of restaurant URLs to scrape them all at once (leave blank for one restaurant): ").strip()
+    if url_file:
+        # Scrape every restaurant listed in the file in a single run
+        subprocess.run([sys.executable, 'zomato-review-scraper.py', '--url-file', url_file])
+    else:
+        # Call the zomato-review-scraper.py here
+        os.system("python zomato-review-scraper.py")
 
 
 def analyze_sentiments():
     """ Function to run sentiment analysis on the scraped reviews. """
     print("Running sentiment analysis...")
-    # Call the sentiment-analyzer.py here
-    os.system("python sentiment-analyzer.py")
+    batch = input("Analyze every new review file at once? (y/n): ").strip().lower()
+    if batch == 'y':
+        # Analyze all pending files on every core
+        subprocess.run([sys.executable, 'sentiment-analyzer.py', '--batch', '--workers', str(os.cpu_count() or 1)])
+    else:
+        # Call the sentiment-analyzer.py here
+        os.system("python sentiment-analyzer.py")
 
 
 def launch_overview_dashboard():
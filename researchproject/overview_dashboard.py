@@ -1,15 +1,59 @@
-import os
-import base64
-from io import BytesIO
+import sys
+import tempfile
+import time
+import numpy as np
 import pandas as pd
-import matplotlib.pyplot as plt
-from wordcloud import WordCloud
-import matplotlib
 import plotly.express as px
 from flask import Flask, render_template
-from dash import Dash, dcc, html, Input, Output, dash_table
+from dash import Dash, ctx, dcc, html, Input, Output, dash_table
+from aggregate_cube import build_cube, load_cube, restaurant_cube, rollup, select_cells
+from background_jobs import PROGRESS_HIDDEN, PROGRESS_VISIBLE, WORDCLOUD_DIRECTORY, job_manager
+from frame_cache import FrameCache
+from sentiment_db import load_sentiment, restaurant_names, sentiment_version
+from storage import sentiment_categories
+from token_index import TokenIndex, load_token_index
+from wordcloud_service import WordCloudService, cell_groups, count_groups, word_frequencies
+
+# Columns of the sentiment files used by the dashboard (the neg/neu/pos scores are never read)
+DASHBOARD_COLUMNS = ['Review', 'compound', 'Category', 'Rating', 'Date', 'BagOfWordsSize', 'NamedEntitiesCount']
+
+TABLE_COLUMNS = [{"name": "Review", "id": "Review"}, {"name": "Category", "id": "Category"}]
+TABLE_PAGE_SIZE = 20
+
+SENTIMENTS = ['Positive', 'Neutral', 'Negative']
+SENTIMENT_FILTERS = {'positive': 'Positive', 'neutral': 'Neutral', 'negative': 'Negative'}
+
+# Prepared frames of the restaurants viewed recently, shared by every session of this process
+frame_cache = FrameCache()
+# Word clouds and their word counts, shared by every background job
+wordcloud_service = WordCloudService(WORDCLOUD_DIRECTORY)
+
+
+def prepare_frame(df, restaurant_url):
+    """Parse the dates and flag the sentiment of every review once, returning the frame, URL and month options"""
+    df['Date'] = pd.to_datetime(df['Date'], errors='coerce')
+    df['Month-Year'] = df['Date'].dt.to_period('M').astype(str)
+    df['Positive'] = df['compound'] > 0
+    df['Neutral'] = df['compound'] == 0
+    df['Negative'] = df['compound'] < 0
+    month_options = [{"label": month, "value": month} for month in df['Month-Year'].unique()]
+    return df, restaurant_url, month_options
+
+
+def prepare_restaurant(restaurant_name):
+    """Load the results of a restaurant, its token index (None if it has none) and its aggregate cube (built from
+    the results if it has none) and prepare them for the dashboard"""
+    df, restaurant_url, month_options = prepare_frame(*load_sentiment(restaurant_name, columns=DASHBOARD_COLUMNS))
+    cube = load_cube(restaurant_name, len(df))
+    if cube is None:
+        cube = build_cube(df)
+    return df, restaurant_url, month_options, load_token_index(restaurant_name, len(df)), cube
+
+
+def load_restaurant(restaurant_name, version):
+    """Return the prepared results of a restaurant, from the frame cache unless they were re-analyzed since"""
+    return frame_cache.get(restaurant_name, version, lambda: prepare_restaurant(restaurant_name))
 
-matplotlib.use('Agg')  # For non-interactive backend
 
 # Initialize Flask server
 server = Flask(__name__)
@@ -19,7 +63,8 @@ external_stylesheets = [
 ]
 
 # Initialize Dash app
-app_dash = Dash(__name__, server=server, url_base_pathname='/dash/', external_stylesheets=external_stylesheets)
+app_dash = Dash(__name__, server=server, url_base_pathname='/dash/', external_stylesheets=external_stylesheets,
+                background_callback_manager=job_manager())
 
 # Dash Layout
 app_dash.layout = html.Div([
@@ -59,8 +104,8 @@ app_dash.layout = html.Div([
     # Dropdowns
     dcc.Dropdown(
         id="file-dropdown",
-        options=[{"label": file, "value": file} for file in os.listdir("Sentiments") if file.endswith('_sentiment.csv')],
-        placeholder="Select a CSV File",
+        options=[{"label": name, "value": name} for name in restaurant_names()],
+        placeholder="Select a Restaurant",
         style={'fontFamily': 'Montserrat'}
     ),
 
@@ -99,6 +144,18 @@ app_dash.layout = html.Div([
         html.Div([
             dash_table.DataTable(
                 id='reviews-table',
+                columns=TABLE_COLUMNS,
+                data=[],
+                # Paging, sorting and filtering run in update_table, so only one page of rows is sent
+                page_action='custom',
+                page_current=0,
+                page_size=TABLE_PAGE_SIZE,
+                page_count=0,
+                sort_action='custom',
+                sort_mode='single',
+                sort_by=[],
+                filter_action='custom',
+                filter_query='',
                 style_table={'height': '80vh', 'overflowY': 'auto'},
                 style_cell={
                     'textAlign': 'left',
@@ -121,7 +178,10 @@ app_dash.layout = html.Div([
         html.Div([
             html.Div([
                 dcc.Graph(id="sentiment-pie-chart", style={'width': '50%', 'height': '325px'}),
-                html.Img(id="wordcloud-image", style={'width': '52.5%', 'height': '200px', 'margin': 'auto'})
+                html.Div([
+                    html.Img(id="wordcloud-image", style={'width': '100%', 'height': '200px'}),
+                    html.Progress(id="wordcloud-progress", style=PROGRESS_HIDDEN)
+                ], style={'width': '52.5%', 'margin': 'auto'})
             ], style={'display': 'flex', 'justify-content': 'space-between', 'max-width': '100%'}),
             dcc.Graph(id="monthly-sentiment-line-chart", style={'width': '100%', 'height': '400px'}),
             dcc.Graph(id="monthly-reviews-graph")
@@ -130,21 +190,50 @@ app_dash.layout = html.Div([
 ], style={'fontFamily': 'Montserrat'})
 
 
-# Callback
+# Callbacks: each one only runs when its own inputs change. They share the prepared frame of the
+# restaurant and the frame filtered by sentiment, month and search, both cached in frame_cache.
+# Charts and metrics are rolled up from the aggregate cube of the restaurant.
+def current_restaurant(restaurant_name):
+    """Return the source of a restaurant (its name and results version) and its prepared results"""
+    version = sentiment_version(restaurant_name)
+    return ((restaurant_name, version), *load_restaurant(restaurant_name, version))
+
+
 @app_dash.callback(
-    [Output("sentiment-pie-chart", "figure"),
-     Output("wordcloud-image", "src"),
-     Output("reviews-table", "data"),
-     Output("reviews-table", "columns"),
-     Output("restaurant-url", "children"),
-     Output("monthly-reviews-graph", "figure"),
+    [Output("restaurant-url", "children"),
      Output("month-filter", "options"),
+     Output("avg-rating", "children")],
+    Input("file-dropdown", "value")
+)
+def update_restaurant(restaurant_name):
+    if restaurant_name is None:
+        return "", [], ""
+
+    _, _, restaurant_url, month_options, _, cube = current_restaurant(restaurant_name)
+    return restaurant_outputs(cube, restaurant_url, month_options)
+
+
+@app_dash.callback(
+    [Output("monthly-sentiment-line-chart", "figure"),
+     Output("monthly-reviews-graph", "figure"),
+     Output("bowsize-trend", "figure"),
+     Output("nersize-trend", "figure")],
+    [Input("file-dropdown", "value"),
+     Input("sentiment-filter", "value"),
+     Input("month-filter", "value")]
+)
+def update_trends(restaurant_name, sentiment_filter, selected_month):
+    if restaurant_name is None:
+        return {}, {}, {}, {}
+
+    _, _, _, _, _, cube = current_restaurant(restaurant_name)
+    return trend_figures(rollup(selected_cells(cube, sentiment_filter, selected_month), by='Month-Year'))
+
+
+@app_dash.callback(
+    [Output("sentiment-pie-chart", "figure"),
      Output("compound-score", "children"),
-     Output("avg-rating", "children"),
      Output("total-reviews", "children"),
-     Output("monthly-sentiment-line-chart", "figure"),
-     Output("bowsize-trend", "figure"),
-     Output("nersize-trend", "figure"),
      Output("avg-bowsize", "children"),
      Output("avg-nersize", "children")],
     [Input("file-dropdown", "value"),
@@ -152,117 +241,325 @@ app_dash.layout = html.Div([
      Input("month-filter", "value"),
      Input("search-bar", "value")]
 )
-def update_dashboard(file_name, sentiment_filter, selected_month, search_term):
-    if file_name is None:
-        return {}, "", [], [], "", {}, [], "", "", "", {}, {}, {}, "", ""
+def update_summary(restaurant_name, sentiment_filter, selected_month, search_term):
+    if restaurant_name is None:
+        return {}, "", "", "", ""
 
-    file_path = os.path.join("Sentiments", file_name)
-    first_row = pd.read_csv(file_path, nrows=1, header=None)
-    restaurant_url = first_row.iloc[0, 0]
-    df = pd.read_csv(file_path, skiprows=1)
+    source, df, _, _, index, cube = current_restaurant(restaurant_name)
+    return summary_outputs(summary_totals(source, df, index, cube, sentiment_filter, selected_month, search_term))
 
-    df['Date'] = pd.to_datetime(df['Date'], errors='coerce')
-    df['Month-Year'] = df['Date'].dt.to_period('M').astype(str)
-    month_options = [{"label": month, "value": month} for month in df['Month-Year'].unique()]
 
-    # Filtering
-    if sentiment_filter:
-        conditions = []
-        if "positive" in sentiment_filter:
-            conditions.append(df['Sentiment'].apply(lambda x: eval(x).get('compound', 0) > 0))
-        if "neutral" in sentiment_filter:
-            conditions.append(df['Sentiment'].apply(lambda x: eval(x).get('compound', 0) == 0))
-        if "negative" in sentiment_filter:
-            conditions.append(df['Sentiment'].apply(lambda x: eval(x).get('compound', 0) < 0))
-        sentiment_condition = conditions[0]
-        for condition in conditions[1:]:
-            sentiment_condition |= condition
-        filtered_df = df[sentiment_condition]
-    else:
-        filtered_df = df
+# The word cloud is drawn by a background job, which reports its progress below the image
+@app_dash.callback(
+    Output("wordcloud-image", "src"),
+    [Input("file-dropdown", "value"),
+     Input("sentiment-filter", "value"),
+     Input("month-filter", "value"),
+     Input("search-bar", "value")],
+    background=True,
+    progress=[Output("wordcloud-progress", "value"), Output("wordcloud-progress", "max")],
+    running=[(Output("wordcloud-progress", "style"), PROGRESS_VISIBLE, PROGRESS_HIDDEN)],
+    interval=500
+)
+def update_wordcloud(set_progress, restaurant_name, sentiment_filter, selected_month, search_term):
+    if restaurant_name is None:
+        return ""
+
+    # Jobs run in a process of their own, so the restaurant is only loaded if the image and word counts need it
+    set_progress((0, 1))
+    source = (restaurant_name, sentiment_version(restaurant_name))
+
+    def frequencies():
+        cube = restaurant_cube(restaurant_name)
+        return dashboard_frequencies(source, cube, lambda: load_restaurant(*source),
+                                     lambda: load_token_index(restaurant_name, cube['Reviews'].sum()),
+                                     wordcloud_service, sentiment_filter, selected_month, search_term)
 
+    return wordcloud_service.render((source, *filter_key(sentiment_filter, selected_month, search_term)), 800, 400,
+                                    frequencies)
+
+
+def filter_reviews(df, index, sentiment_filter, selected_month, search_term):
+    """Apply the sentiment and month filters as one mask, then search the text of the remaining reviews only.
+    With a token index only the reviews whose terms can contain the search term are searched."""
+    mask = np.ones(len(df), dtype=bool)
+    if sentiment_filter:
+        mask &= df['Category'].isin([SENTIMENT_FILTERS[value] for value in sentiment_filter]).to_numpy()
     if selected_month:
-        filtered_df = filtered_df[filtered_df['Month-Year'].isin(selected_month)]
+        mask &= df['Month-Year'].isin(selected_month).to_numpy()
+    candidates = index.search(search_term) if search_term and index is not None else None
+    if candidates is not None:
+        in_candidates = np.zeros(len(df), dtype=bool)
+        in_candidates[candidates] = True
+        mask &= in_candidates
+    filtered_df = df[mask]
 
     if search_term:
-        search_term = search_term.lower()
-        filtered_df = filtered_df[filtered_df['Review'].str.contains(search_term, case=False, na=False)]
-
-    # Sentiment pie
-    sentiment_counts = {
-        'Positive': (filtered_df['Sentiment'].apply(lambda x: eval(x).get('compound', 0) > 0)).sum(),
-        'Neutral': (filtered_df['Sentiment'].apply(lambda x: eval(x).get('compound', 0) == 0)).sum(),
-        'Negative': (filtered_df['Sentiment'].apply(lambda x: eval(x).get('compound', 0) < 0)).sum()
-    }
-    fig_sentiment = px.pie(
-        names=list(sentiment_counts.keys()),
-        values=list(sentiment_counts.values()),
-        color=list(sentiment_counts.keys()),
-        color_discrete_map={'Positive': 'green', 'Neutral': 'yellow', 'Negative': 'red'},
-        title="Review Sentiment Distribution"
-    )
+        filtered_df = filtered_df[filtered_df['Review'].str.contains(search_term, case=False, na=False, regex=False)]
+    return filtered_df
 
-    # Wordcloud
-    wordcloud = WordCloud(width=800, height=400, background_color='white').generate(
-        ' '.join(filtered_df['Review'].dropna()))
-    buffer = BytesIO()
-    plt.figure(figsize=(10, 5))
-    plt.imshow(wordcloud, interpolation='bilinear')
-    plt.axis("off")
-    plt.savefig(buffer, format="png")
-    plt.close()
-    image_base64 = base64.b64encode(buffer.getvalue()).decode()
-
-    # Table
-    reviews_data = [{"Review": row['Review'],
-                     "Category": "Positive" if eval(row['Sentiment']).get('compound', 0) > 0 else "Neutral" if eval(
-                         row['Sentiment']).get('compound', 0) == 0 else "Negative"} for _, row in filtered_df.iterrows()]
-    columns = [{"name": "Review", "id": "Review"}, {"name": "Category", "id": "Category"}]
-
-    # Metrics
-    compound_score = filtered_df['Sentiment'].apply(lambda x: eval(x).get('compound', 0)).mean().round(3)
-    avg_rating = df['Rating'].mean().round(2) if 'Rating' in df.columns else "N/A"
-    total_reviews = len(filtered_df)
-
-    avg_bowsize = filtered_df['BagOfWordsSize'].mean().round(2)
-    avg_nersize = filtered_df['NamedEntitiesCount'].mean().round(2)
 
-    # Monthly line chart (sentiments)
-    monthly_sentiment_counts = filtered_df.groupby(['Month-Year']).apply(lambda x: pd.Series({
-        'Positive': (x['Sentiment'].apply(lambda s: eval(s).get('compound', 0) > 0)).sum(),
-        'Neutral': (x['Sentiment'].apply(lambda s: eval(s).get('compound', 0) == 0)).sum(),
-        'Negative': (x['Sentiment'].apply(lambda s: eval(s).get('compound', 0) < 0)).sum()
-    })).reset_index()
+def filter_key(sentiment_filter, selected_month, search_term):
+    """Identify a filter state, whatever the order the values were picked in"""
+    return tuple(sorted(sentiment_filter or [])), tuple(sorted(selected_month or [])), (search_term or '').lower()
+
+
+def filtered_frame(source, df, index, sentiment_filter, selected_month, search_term):
+    """Return the reviews of the source matching the filters, cached for its results version so that
+    every callback fired by the same change filters the frame only once"""
+    restaurant_name, version = source
+    return frame_cache.get((restaurant_name, 'filtered', filter_key(sentiment_filter, selected_month, search_term)),
+                           version, lambda: filter_reviews(df, index, sentiment_filter, selected_month, search_term))
+
+
+def dashboard_frequencies(source, cube, load, load_index, service, sentiment_filter, selected_month, search_term):
+    """Count the words of the reviews matching the filters. A search filters the prepared results returned by
+    load() and counts the matching reviews, from the token index when there is one. Without a sentiment filter
+    the monthly term counts of the token index returned by load_index() are summed, if there is an index.
+    Otherwise the counts of every sentiment and month group picked in the cube are summed from the word cloud
+    service, and the results are only loaded to count the groups it does not hold yet."""
+    if search_term:
+        df, _, _, index, _ = load()
+        filtered_df = filtered_frame(source, df, index, sentiment_filter, selected_month, search_term)
+        if index is not None:
+            return index.review_frequencies(filtered_df.index.to_numpy())
+        return word_frequencies(filtered_df['Review'].tolist())
+
+    if not sentiment_filter:
+        index = load_index()
+        if index is not None:
+            return index.month_frequencies(selected_month or None)
+
+    def count_missing(groups):
+        df, _, _, index, _ = load()
+        return count_groups(df, groups, index)
+
+    return service.group_frequencies(source, cell_groups(selected_cells(cube, sentiment_filter, selected_month)),
+                                     count_missing)
+
+
+def selected_cells(cube, sentiment_filter, selected_month):
+    """Keep the cells of the cube matching the sentiment and month filters"""
+    return select_cells(cube, [SENTIMENT_FILTERS[value] for value in sentiment_filter or []], selected_month)
+
+
+def restaurant_outputs(cube, restaurant_url, month_options):
+    """Return the outputs that only depend on the restaurant: its link, month options and average rating"""
+    rating = rollup(cube).iloc[0]['Rating']
+    avg_rating = round(rating, 2) if pd.notna(rating) else "N/A"
+    restaurant_url_link = html.A("Click to go to restaurant's page", href=restaurant_url, target="_blank")
+    return restaurant_url_link, month_options, avg_rating
+
 
+def trend_figures(monthly):
+    """Draw the monthly trend charts from the cube of the reviews filtered by sentiment and month, rolled up by month"""
+    monthly = monthly.reset_index().rename(columns={'Reviews': 'Review Count'})
+
+    # Monthly line chart (sentiments)
     fig_monthly_sentiment = px.line(
-        monthly_sentiment_counts, x='Month-Year', y=['Positive', 'Neutral', 'Negative'],
+        monthly, x='Month-Year', y=SENTIMENTS,
         title="Monthly Sentiment Trend",
         labels={'value': 'Number of Reviews', 'variable': 'Sentiment'},
         color_discrete_map={'Positive': 'green', 'Neutral': 'yellow', 'Negative': 'red'}
     )
 
     # Monthly Reviews
-    if not filtered_df.empty:
-        monthly_reviews_count = filtered_df.groupby('Month-Year').size().reset_index(name='Review Count')
-        fig_monthly_reviews = px.bar(monthly_reviews_count, x='Month-Year', y='Review Count', title="Monthly Review Count")
+    if not monthly.empty:
+        fig_monthly_reviews = px.bar(monthly, x='Month-Year', y='Review Count', title="Monthly Review Count")
     else:
         fig_monthly_reviews = {}
 
     # BOW size trend
-    bowsize_trend = filtered_df.groupby('Month-Year')['BagOfWordsSize'].mean().reset_index()
-    fig_bowsize = px.line(bowsize_trend, x='Month-Year', y='BagOfWordsSize', title="Avg BagOfWords Size Over Time")
+    fig_bowsize = px.line(monthly, x='Month-Year', y='BagOfWordsSize', title="Avg BagOfWords Size Over Time")
 
     # NER size trend
-    nersize_trend = filtered_df.groupby('Month-Year')['NamedEntitiesCount'].mean().reset_index()
-    fig_nersize = px.line(nersize_trend, x='Month-Year', y='NamedEntitiesCount', title="Avg Named Entities Over Time")
+    fig_nersize = px.line(monthly, x='Month-Year', y='NamedEntitiesCount', title="Avg Named Entities Over Time")
 
-    restaurant_url_link = html.A("Click to go to restaurant's page", href=restaurant_url, target="_blank")
+    return fig_monthly_sentiment, fig_monthly_reviews, fig_bowsize, fig_nersize
+
+
+def summary_totals(source, df, index, cube, sentiment_filter, selected_month, search_term):
+    """Roll up the totals of the filtered reviews from the cube. The cube knows nothing of the review text,
+    so with a search they are summed from the matching reviews instead."""
+    if search_term:
+        return row_totals(filtered_frame(source, df, index, sentiment_filter, selected_month, search_term))
+    return rollup(selected_cells(cube, sentiment_filter, selected_month)).iloc[0]
+
+
+def row_totals(filtered_df):
+    """Sum the filtered reviews into the totals rollup returns for the cells of a cube"""
+    totals = filtered_df[SENTIMENTS].sum()
+    totals['Reviews'] = len(filtered_df)
+    for column in ['compound', 'BagOfWordsSize', 'NamedEntitiesCount']:
+        totals[column] = filtered_df[column].mean()
+    return totals
+
+
+def summary_outputs(totals):
+    """Return the sentiment pie chart and the metrics of the filtered reviews from their totals"""
+    fig_sentiment = px.pie(
+        names=SENTIMENTS,
+        values=[int(totals[sentiment]) for sentiment in SENTIMENTS],
+        color=SENTIMENTS,
+        color_discrete_map={'Positive': 'green', 'Neutral': 'yellow', 'Negative': 'red'},
+        title="Review Sentiment Distribution"
+    )
 
-    return (fig_sentiment, f"data:image/png;base64,{image_base64}", reviews_data, columns,
-            restaurant_url_link, fig_monthly_reviews, month_options,
-            compound_score, avg_rating, total_reviews,
-            fig_monthly_sentiment, fig_bowsize, fig_nersize,
-            avg_bowsize, avg_nersize)
+    compound_score = round(totals['compound'], 3)
+    total_reviews = int(totals['Reviews'])
+    avg_bowsize = round(totals['BagOfWordsSize'], 2)
+    avg_nersize = round(totals['NamedEntitiesCount'], 2)
+    return fig_sentiment, compound_score, total_reviews, avg_bowsize, avg_nersize
+
+
+# Operators of the table's filter row, as they appear in its filter_query
+FILTER_OPERATORS = [['ge', '>='], ['le', '<='], ['lt', '<'], ['gt', '>'], ['ne', '!='], ['eq', '='],
+                    ['contains'], ['datestartswith']]
+
+
+def split_filter_part(filter_part):
+    """Split one clause of a filter_query into its column, operator and value. The operator is the token right
+    after the closing brace of the column, so operator text inside the value is left alone."""
+    name_start, name_end = filter_part.find('{'), filter_part.find('}')
+    if name_start == -1 or name_end < name_start:
+        return None, None, None
+    name = filter_part[name_start + 1: name_end]
+    rest = filter_part[name_end + 1:].lstrip()
+    for operator_type in FILTER_OPERATORS:
+        for operator in operator_type:
+            # Word operators must be followed by a space, symbols may touch the value
+            if rest.startswith(operator + ' ') or (not operator.isalpha() and rest.startswith(operator)):
+                value_part = rest[len(operator):].strip()
+                quote = value_part[:1]
+                if len(value_part) > 1 and quote == value_part[-1] and quote in ("'", '"', '`'):
+                    value = value_part[1:-1].replace('\\' + quote, quote)
+                else:
+                    value = value_part
+                return name, operator_type[0], value
+    return None, None, None
+
+
+def apply_table_filter(df, filter_query):
+    """Keep the rows matching the clauses typed in the filter row of the table"""
+    for filter_part in (filter_query or '').split(' && '):
+        name, operator, value = split_filter_part(filter_part)
+        if name not in df.columns:
+            continue
+        column = df[name].fillna('')
+        if operator == 'contains':
+            df = df[column.str.contains(value, case=False, regex=False)]
+        elif operator == 'datestartswith':
+            df = df[column.str.startswith(value)]
+        elif operator in ('eq', 'ne', 'lt', 'le', 'gt', 'ge'):
+            df = df[getattr(column, operator)(value)]
+    return df
+
+
+def sorted_positions(source, df, column, ascending=True):
+    """Return the row positions of df in order of the column, cached for the results version.
+    The sort is stable both ways, so rows with equal values keep their original order."""
+    restaurant_name, version = source
+    return frame_cache.get((restaurant_name, 'order', column, ascending), version,
+                           lambda: df[column].fillna('').sort_values(ascending=ascending, kind='stable').index.to_numpy())
+
+
+def table_page(source, df, index, sentiment_filter, selected_month, search_term, page_current, page_size, sort_by,
+               filter_query):
+    """Return the rows of one page of the reviews table, the number of pages and the page actually shown"""
+    filtered_df = apply_table_filter(filtered_frame(source, df, index, sentiment_filter, selected_month, search_term),
+                                     filter_query)
+    positions = filtered_df.index.to_numpy()
+
+    sort = next((s for s in sort_by or [] if s['column_id'] in df.columns), None)
+    if sort:
+        order = sorted_positions(source, df, sort['column_id'], ascending=sort['direction'] != 'desc')
+        selected = np.zeros(len(df), dtype=bool)
+        selected[positions] = True
+        positions = order[selected[order]]
+
+    page_count = max(1, -(-len(positions) // page_size))
+    page_current = min(page_current or 0, page_count - 1)
+    page = positions[page_current * page_size:(page_current + 1) * page_size]
+    rows = [{'Review': review, 'Category': category}
+            for review, category in zip(df['Review'].to_numpy()[page].tolist(), df['Category'].to_numpy()[page].tolist())]
+    return rows, page_count, page_current
+
+
+@app_dash.callback(
+    [Output("reviews-table", "data"),
+     Output("reviews-table", "page_count"),
+     Output("reviews-table", "page_current")],
+    [Input("file-dropdown", "value"),
+     Input("sentiment-filter", "value"),
+     Input("month-filter", "value"),
+     Input("search-bar", "value"),
+     Input("reviews-table", "page_current"),
+     Input("reviews-table", "page_size"),
+     Input("reviews-table", "sort_by"),
+     Input("reviews-table", "filter_query")]
+)
+def update_table(restaurant_name, sentiment_filter, selected_month, search_term, page_current, page_size, sort_by,
+                 filter_query):
+    if restaurant_name is None:
+        return [], 0, 0
+
+    # Anything but turning the page starts again from the first page
+    if "reviews-table.page_current" not in ctx.triggered_prop_ids:
+        page_current = 0
+
+    source, df, _, _, index, _ = current_restaurant(restaurant_name)
+    return table_page(source, df, index, sentiment_filter, selected_month, search_term,
+                      page_current, page_size, sort_by, filter_query)
+
+
+def synthetic_results(num_reviews, seed=0):
+    """Build sentiment results of random reviews over two years, to benchmark the dashboard without real data"""
+    rng = np.random.default_rng(seed)
+    words = np.array(['food', 'service', 'ambience', 'great', 'slow', 'tasty', 'cold', 'staff', 'price', 'biryani',
+                      'friendly', 'rude', 'fresh', 'portion', 'dessert', 'coffee', 'crowded', 'clean', 'noisy', 'value'])
+    lengths = rng.integers(5, 60, num_reviews)
+    text = rng.choice(words, lengths.sum())
+    reviews = [' '.join(chunk) for chunk in np.split(text, np.cumsum(lengths)[:-1])]
+    compound = np.round(rng.uniform(-1, 1, num_reviews), 4) * (rng.random(num_reviews) > 0.1)
+    dates = pd.Timestamp('2023-01-01') + pd.to_timedelta(rng.integers(0, 730, num_reviews), unit='D')
+    return pd.DataFrame({'Review': reviews, 'compound': compound, 'Category': sentiment_categories(compound),
+                         'Rating': rng.integers(1, 6, num_reviews).astype(float), 'Date': dates.strftime('%Y-%m-%d'),
+                         'BagOfWordsSize': lengths, 'NamedEntitiesCount': rng.integers(0, 5, num_reviews)})
+
+
+def benchmark_callback(sizes=(1000, 10000, 100000), repeat=3):
+    """Time what each interaction runs on synthetic restaurants of the given sizes: opening a restaurant runs
+    every callback, a sentiment and month change all but the restaurant one, and a search only the summary,
+    word cloud and table. The first run of each scenario filters the frame and draws its word cloud,
+    the best of the repeats shows cached ones. Charts and metrics are rolled up from the cube unless searching."""
+    scenarios = {'open': (None, None, None, True, True),
+                 'sentiment + month': (['positive', 'neutral'], ['2023-06', '2024-02'], None, False, True),
+                 'search': (None, None, 'tasty', False, False)}
+    print(f"{'reviews':>8} " + ' '.join(f"{name + ' (first/best)':>28}" for name in scenarios))
+    service = WordCloudService(tempfile.mkdtemp())  # Not the shared cache, so every benchmark starts cold
+    for size in sizes:
+        df, restaurant_url, month_options = prepare_frame(synthetic_results(size), "https://www.zomato.com/")
+        index = TokenIndex.build(df['Review'].tolist(), df['Month-Year'])
+        cube = build_cube(df)
+        prepared = (df, restaurant_url, month_options, index, cube)
+        source = ('synthetic', size)
+        timings = []
+        for sentiment_filter, selected_month, search_term, opened, trends in scenarios.values():
+            runs = []
+            for _ in range(repeat):
+                start = time.perf_counter()
+                if opened:
+                    restaurant_outputs(cube, restaurant_url, month_options)
+                if trends:
+                    trend_figures(rollup(selected_cells(cube, sentiment_filter, selected_month), by='Month-Year'))
+                summary_outputs(summary_totals(source, df, index, cube, sentiment_filter, selected_month, search_term))
+                service.render((source, *filter_key(sentiment_filter, selected_month, search_term)), 800, 400,
+                               lambda: dashboard_frequencies(source, cube, lambda: prepared, lambda: index, service,
+                                                             sentiment_filter, selected_month, search_term))
+                table_page(source, df, index, sentiment_filter, selected_month, search_term, 0, TABLE_PAGE_SIZE, [], '')
+                runs.append(time.perf_counter() - start)
+            timings.append((runs[0], min(runs)))
+        print(f"{size:>8} " + ' '.join(f"{first * 1000:>16.0f} / {best * 1000:>5.0f} ms" for first, best in timings))
 
 
 # Flask route
@@ -271,7 +568,10 @@ def index():
     return render_template("index.html")
 
 
-# Run Flask server
+# Run Flask server, or time the callbacks with --benchmark
 if __name__ == '__main__':
-    server.run(debug=True)
+    if '--benchmark' in sys.argv:
+        benchmark_callback()
+    else:
+        server.run(debug=True)
 
@@ -0,0 +1,85 @@
+import os
+import gzip
+import json
+import time
+import hashlib
+import threading
+
+
+class PageCache:
+    """Gzip-compressed on-disk cache of raw review pages, keyed by page link (restaurant URL, page and sort).
+    Entries older than ttl seconds count as misses, and once the cache grows past max_bytes
+    the least recently used entries are evicted."""
+
+    def __init__(self, directory="Cache", ttl=7 * 24 * 3600, max_bytes=500 * 1024 * 1024):
+        self.directory = directory
+        self.ttl = ttl
+        self.max_bytes = max_bytes
+        self.lock = threading.Lock()
+        os.makedirs(directory, exist_ok=True)
+        self.total_bytes = sum(os.path.getsize(path) for path in self.entry_paths())
+
+    def entry_paths(self):
+        return [os.path.join(self.directory, f) for f in os.listdir(self.directory) if f.endswith('.json.gz')]
+
+    def path(self, link):
+        """Return the file of the cache entry for the link"""
+        return os.path.join(self.directory, hashlib.sha256(link.encode('utf-8')).hexdigest() + '.json.gz')
+
+    def get(self, link, ignore_ttl=False):
+        """Return the cached page text for the link, or None if it is missing or has expired"""
+        path = self.path(link)
+        try:
+            with gzip.open(path, 'rt', encoding='utf-8') as file:
+                entry = json.load(file)
+            os.utime(path)  # Mark the entry as recently used
+        except (OSError, ValueError):
+            return None
+
+        if not ignore_ttl and time.time() - entry['fetched'] > self.ttl:
+            return None
+        return entry['text']
+
+    def pages(self):
+        """Yield the link and page text of every cached page, whatever its age"""
+        for path in self.entry_paths():
+            try:
+                with gzip.open(path, 'rt', encoding='utf-8') as file:
+                    entry = json.load(file)
+            except (OSError, ValueError):
+                continue
+            yield entry['link'], entry['text']
+
+    def put(self, link, text):
+        """Store the page text for the link and evict old entries if the cache is too large"""
+        path = self.path(link)
+        temp_path = f"{path}.{threading.get_ident()}.tmp"
+        with gzip.open(temp_path, 'wt', encoding='utf-8') as file:
+            json.dump({'link': link, 'fetched': time.time(), 'text': text}, file)
+
+        with self.lock:
+            old_size = os.path.getsize(path) if os.path.exists(path) else 0
+            os.replace(temp_path, path)  # Readers never see a half-written entry
+            self.total_bytes += os.path.getsize(path) - old_size
+            if self.total_bytes > self.max_bytes:
+                self.evict()
+
+    def evict(self):
+        """Delete the least recently used entries until the cache fits in max_bytes"""
+        entries = []
+        for path in self.entry_paths():
+            try:
+                stat = os.stat(path)
+                entries.append((stat.st_mtime, stat.st_size, path))
+            except FileNotFoundError:
+                continue
+
+        self.total_bytes = sum(size for _, size, _ in entries)
+        for _, size, path in sorted(entries):
+            if self.total_bytes <= self.max_bytes:
+                break
+            try:
+                os.remove(path)
+                self.total_bytes -= size
+            except FileNotFoundError:
+                continue
@@ -0,0 +1,119 @@
+import random
+import threading
+import time
+from email.utils import parsedate_to_datetime
+from urllib.parse import urlsplit
+
+
+class TokenBucket:
+    """Token bucket handing out `rate` requests per second, with bursts of up to `capacity` requests.
+    The rate halves every time the server pushes back, down to min_rate, and climbs back
+    to the starting rate in small steps while responses are healthy."""
+
+    def __init__(self, rate, capacity=1, min_rate=None):
+        self.rate = rate
+        self.max_rate = rate
+        self.min_rate = min_rate or rate / 20
+        self.capacity = capacity
+        self.tokens = capacity
+        self.updated = time.monotonic()
+        self.lock = threading.Lock()
+
+    def reserve(self):
+        """Take a token and return the number of seconds to wait before it may be used"""
+        with self.lock:
+            now = time.monotonic()
+            self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+            self.updated = now
+            self.tokens -= 1
+            return 0.0 if self.tokens >= 0 else -self.tokens / self.rate
+
+    def slow_down(self):
+        with self.lock:
+            self.rate = max(self.min_rate, self.rate / 2)
+
+    def speed_up(self, step=0.05):
+        """Raise the rate one step and return True once it is back at the starting rate"""
+        with self.lock:
+            self.rate = min(self.max_rate, self.rate + self.max_rate * step)
+            return self.rate >= self.max_rate
+
+
+class RateLimiter:
+    """Global and per-host request rate limits, shared by threads and the event loop alike.
+    A rate of None leaves that limit off until the host answers 429 or 503, after which
+    the host is limited to throttled_rate requests per second and adapts from there, until the
+    limit is lifted again once that rate is back up to throttled_rate."""
+
+    def __init__(self, rate=None, per_host_rate=None, throttled_rate=2.0):
+        self.bucket = TokenBucket(rate) if rate else None
+        self.per_host_rate = per_host_rate
+        self.throttled_rate = throttled_rate
+        self.host_buckets = {}
+        self.lock = threading.Lock()
+
+    def host_bucket(self, link, create=True):
+        """Return the token bucket of the host of the link, creating it unless create is False"""
+        host = urlsplit(link).netloc
+        with self.lock:
+            if host not in self.host_buckets and create:
+                self.host_buckets[host] = TokenBucket(self.per_host_rate or self.throttled_rate)
+            return self.host_buckets.get(host)
+
+    def reserve(self, link):
+        """Reserve a request to the link and return the number of seconds to wait before sending it"""
+        delay = self.bucket.reserve() if self.bucket else 0.0
+        bucket = self.host_bucket(link, create=bool(self.per_host_rate))
+        if bucket:
+            delay = max(delay, bucket.reserve())
+        return delay
+
+    def throttled(self, link):
+        """Slow down after the host of the link answered 429 or 503"""
+        self.host_bucket(link).slow_down()
+        if self.bucket:
+            self.bucket.slow_down()
+
+    def succeeded(self, link):
+        """Speed back up after a healthy response from the host of the link"""
+        bucket = self.host_bucket(link, create=False)
+        if bucket and bucket.speed_up() and not self.per_host_rate:
+            with self.lock:
+                self.host_buckets.pop(urlsplit(link).netloc, None)
+        if self.bucket:
+            self.bucket.speed_up()
+
+    def acquire(self, link):
+        """Block until a request to the link is allowed"""
+        delay = self.reserve(link)
+        if delay > 0:
+            time.sleep(delay)
+
+
+class RetryPolicy:
+    """Exponential backoff with full jitter for failed requests, honouring the server's Retry-After"""
+
+    def __init__(self, retries=4, base_delay=1.0, max_delay=60.0):
+        self.retries = retries
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+
+    def delay(self, attempt, retry_after=None):
+        """Return the number of seconds to wait before retrying after the given failed attempt (0-based)"""
+        if retry_after is not None:
+            return min(retry_after, self.max_delay)
+        return random.uniform(0, min(self.max_delay, self.base_delay * 2 ** attempt))
+
+
+def parse_retry_after(value):
+    """Return the seconds asked for by a Retry-After header, given either as seconds or as an HTTP date"""
+    if not value:
+        return None
+    try:
+        return max(0.0, float(value))
+    except ValueError:
+        pass
+    try:
+        return max(0.0, parsedate_to_datetime(value).timestamp() - time.time())
+    except (TypeError, ValueError):
+        return None
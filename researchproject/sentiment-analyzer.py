@@ -1,57 +1,100 @@
 import os
+import sys
+import json
+import time
+import datetime
+import hashlib
+import sqlite3
+import argparse
+import functools
 import pandas as pd
+from concurrent.futures import ProcessPoolExecutor, as_completed
 import nltk
 from nltk.sentiment.vader import SentimentIntensityAnalyzer
 from nltk import word_tokenize, pos_tag, ne_chunk
+from nltk.chunk import ne_chunker
 from nltk.corpus import stopwords
+from nltk.tag import PerceptronTagger
 from nltk.tree import Tree
+from aggregate_cube import build_cube, cube_path, save_cube
+from sentiment_db import SentimentStore, restaurant_names, superseded_restaurants
+from token_index import TokenIndex, index_path, review_months
+from storage import FORMATS, find_table, is_table_file, read_table, sentiment_categories, table_format, table_path, write_table
+
+# Bump whenever a change to the analysis changes its results, so cached results are not reused
+ANALYZER_VERSION = 1
+
 
 # Download necessary NLTK resources
-nltk.download('vader_lexicon')
-nltk.download('punkt')
-nltk.download('averaged_perceptron_tagger')
-nltk.download('maxent_ne_chunker')
-nltk.download('words')
-nltk.download('stopwords')
+def download_nltk_resources():
+    nltk.download('vader_lexicon')
+    nltk.download('punkt')
+    nltk.download('averaged_perceptron_tagger')
+    nltk.download('maxent_ne_chunker')
+    nltk.download('words')
+    nltk.download('stopwords')
+
+
+# Analysis engine holding the NLTK models, loaded once and reused for every review
+class SentimentEngine:
+    def __init__(self):
+        self.sid = SentimentIntensityAnalyzer()
+        self.stop_words = set(stopwords.words('english'))
+        self.tagger = PerceptronTagger()
+        self.chunker = ne_chunker()
+
+    # Perform text processing
+    def process_text(self, text):
+        tokens = word_tokenize(text)
+        tokens = [t.lower() for t in tokens if t.isalpha()]
+        filtered_tokens = [t for t in tokens if t not in self.stop_words and len(t) > 2]
+
+        pos_tags = self.tagger.tag(filtered_tokens)
+        named_entities = []
+        chunked = self.chunker.parse(pos_tags)
+
+        for chunk in chunked:
+            if isinstance(chunk, Tree):
+                entity = " ".join(c[0] for c in chunk)
+                named_entities.append(entity)
+
+        return {
+            'tokens': filtered_tokens,
+            'pos_tags': pos_tags,
+            'bag_of_words': list(set(filtered_tokens)),
+            'named_entities': named_entities
+        }
 
+    # Analyze sentiment of a review
+    def analyze_sentiment(self, review):
+        return self.sid.polarity_scores(review)
 
-# Function to perform text processing
-def process_text(text):
-    tokens = word_tokenize(text)
-    stop_words = set(stopwords.words('english'))
-    tokens = [t.lower() for t in tokens if t.isalpha()]
-    filtered_tokens = [t for t in tokens if t not in stop_words and len(t) > 2]
 
-    pos_tags = pos_tag(filtered_tokens)
-    named_entities = []
-    chunked = ne_chunk(pos_tags)
+_engine = None
 
-    for chunk in chunked:
-        if isinstance(chunk, Tree):
-            entity = " ".join(c[0] for c in chunk)
-            named_entities.append(entity)
 
-    return {
-        'tokens': filtered_tokens,
-        'pos_tags': pos_tags,
-        'bag_of_words': list(set(filtered_tokens)),
-        'named_entities': named_entities
-    }
+# Return the engine shared by the whole process, loading the models on first use
+def get_engine():
+    global _engine
+    if _engine is None:
+        _engine = SentimentEngine()
+    return _engine
+
+
+# Function to perform text processing
+def process_text(text):
+    return get_engine().process_text(text)
 
 
 # Function to analyze sentiment of a review
 def analyze_sentiment(review):
-    sid = SentimentIntensityAnalyzer()
-    sentiment_scores = sid.polarity_scores(review)
-    return sentiment_scores
+    return get_engine().analyze_sentiment(review)
 
 
-# Load CSV file
+# Load a review file (CSV or Parquet)
 def load_reviews_from_csv(file_path):
-    first_row = pd.read_csv(file_path, nrows=1, header=None)
-    restaurant_url = first_row.iloc[0, 0]
-
-    data = pd.read_csv(file_path, skiprows=1)
+    data, metadata = read_table(file_path)
+    restaurant_url = metadata.get('url')
 
     print(f"Columns in {file_path}: {data.columns.tolist()}")
 
@@ -62,23 +105,123 @@ def load_reviews_from_csv(file_path):
         return [], None, restaurant_url
 
 
+# Analyze a single review, returning None if it has no text
+def analyze_review(engine, review):
+    if not (isinstance(review, str) and review.strip()):
+        return None
+
+    sentiment_scores = engine.analyze_sentiment(review)
+    text_features = engine.process_text(review)
+    return {
+        'Review': ' '.join(text_features['tokens']),
+        'Sentiment': sentiment_scores,
+        'TextFeatures': text_features
+    }
+
+
+# Key of a review in the result cache: hash of the analyzer version and the whitespace-normalized text
+def review_key(review):
+    normalized = ' '.join(review.split())
+    return hashlib.sha256(f"{ANALYZER_VERSION}\0{normalized}".encode('utf-8')).hexdigest()
+
+
+# Persistent cache of analysis results keyed by review hash, safe to share between processes
+class ResultCache:
+    def __init__(self, path=os.path.join('Sentiments', 'analysis_cache.sqlite')):
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        self.connection = sqlite3.connect(path, timeout=60)
+        self.connection.execute("CREATE TABLE IF NOT EXISTS results (key TEXT PRIMARY KEY, result TEXT NOT NULL)")
+        self.connection.commit()
+
+    # Return the cached results of the given keys
+    def get_many(self, keys):
+        keys = list(keys)
+        found = {}
+        for i in range(0, len(keys), 500):
+            batch = keys[i:i + 500]
+            query = f"SELECT key, result FROM results WHERE key IN ({','.join('?' * len(batch))})"
+            for key, result in self.connection.execute(query, batch):
+                result = json.loads(result)
+                result['TextFeatures']['pos_tags'] = [tuple(tag) for tag in result['TextFeatures']['pos_tags']]
+                found[key] = result
+        return found
+
+    # Store the results of the given keys
+    def put_many(self, items):
+        with self.connection:
+            self.connection.executemany("INSERT OR REPLACE INTO results (key, result) VALUES (?, ?)",
+                                        ((key, json.dumps(result)) for key, result in items))
+
+    def close(self):
+        self.connection.close()
+
+
+# Load the models once in each worker process
+def init_worker():
+    get_engine()
+
+
+# Analyze a chunk of reviews in a worker process
+def analyze_chunk(reviews):
+    engine = get_engine()
+    return [analyze_review(engine, review) for review in reviews]
+
+
+# Analyze reviews one by one, or in chunks on a pool of worker processes, keeping their order.
+# An existing pool can be passed in to reuse its loaded models across files.
+def analyze_review_list(reviews, engine=None, workers=1, chunk_size=50, executor=None):
+    if (executor or workers > 1) and len(reviews) > chunk_size:
+        chunks = [reviews[i:i + chunk_size] for i in range(0, len(reviews), chunk_size)]
+        if executor:
+            return [result for chunk in executor.map(analyze_chunk, chunks) for result in chunk]
+        with ProcessPoolExecutor(max_workers=workers, initializer=init_worker) as executor:
+            return [result for chunk in executor.map(analyze_chunk, chunks) for result in chunk]
+
+    engine = engine or get_engine()
+    return [analyze_review(engine, review) for review in reviews]
+
+
+# Analyze reviews, scoring only the ones missing from the result cache
+def analyze_with_cache(reviews, cache, engine=None, workers=1, chunk_size=50, executor=None):
+    keys = [review_key(review) if isinstance(review, str) and review.strip() else None for review in reviews]
+    known = cache.get_many({key for key in keys if key})
+
+    # Score every unseen review once, even if it appears several times
+    new_reviews = {}
+    for review, key in zip(reviews, keys):
+        if key and key not in known and key not in new_reviews:
+            new_reviews[key] = review
+
+    if new_reviews:
+        new_results = analyze_review_list(list(new_reviews.values()), engine, workers, chunk_size, executor)
+        known.update(zip(new_reviews.keys(), new_results))
+        cache.put_many((key, known[key]) for key in new_reviews)
+
+    reused = sum(1 for key in keys if key and key not in new_reviews)
+    print(f"{len(new_reviews)} reviews scored, {reused} taken from the result cache.")
+    return [known[key] if key else None for key in keys]
+
+
 # Analyze reviews in the CSV file
-def analyze_reviews(file_path):
+def analyze_reviews(file_path, engine=None, workers=1, chunk_size=50, executor=None, use_cache=True):
     reviews, data, restaurant_url = load_reviews_from_csv(file_path)
     results = []
 
     num_reviews = len(reviews)
     avg_rating = data['Rating'].mean() if 'Rating' in data.columns else 0
 
-    for review in reviews:
-        if isinstance(review, str) and review.strip():
-            sentiment_scores = analyze_sentiment(review)
-            text_features = process_text(review)
-            results.append({
-                'Review': ' '.join(text_features['tokens']),
-                'Sentiment': sentiment_scores,
-                'TextFeatures': text_features
-            })
+    if use_cache:
+        cache = ResultCache()
+        try:
+            analyzed = analyze_with_cache(reviews, cache, engine, workers, chunk_size, executor)
+        finally:
+            cache.close()
+    else:
+        analyzed = analyze_review_list(reviews, engine, workers, chunk_size, executor)
+
+    for review, result in zip(reviews, analyzed):
+        if result is not None:
+            results.append(result)
         else:
             print(f"Warning: Invalid review encountered (skipped): {review}")
 
@@ -95,9 +238,89 @@ def analyze_reviews(file_path):
     return results, aggregated_scores, num_reviews, avg_rating, data, restaurant_url
 
 
-# Let user select a CSV file to analyze
+# Name shared by all the output files of a review file
+def restaurant_file_name(file_path):
+    base_file_name = os.path.splitext(os.path.basename(file_path))[0]
+    return base_file_name.replace('_reviews', '')
+
+
+# List the review files whose sentiment file is missing or older than the reviews
+def find_pending_files(directory='Reviews', output_directory='Sentiments', include_done=False):
+    pending = []
+    for file in sorted(os.listdir(directory)):
+        if not is_table_file(file):
+            continue
+        file_path = os.path.join(directory, file)
+        sentiment_path = find_table(os.path.join(output_directory, restaurant_file_name(file) + '_sentiment'))
+        if include_done or not sentiment_path or os.path.getmtime(sentiment_path) < os.path.getmtime(file_path):
+            pending.append(file_path)
+    return pending
+
+
+# Analyze a whole review file in a worker process
+def analyze_file(file_path, use_cache=True):
+    return analyze_reviews(file_path, use_cache=use_cache)
+
+
+# Analyze every pending review file without prompting, loading the models once per worker process.
+# mode='file' gives each worker whole files, mode='review' splits every file into chunks of reviews.
+# Results are saved by this process only, and the master file is exported once at the end, even if the batch is cut short.
+# A file that fails is reported and skipped, and the list of failed files is returned.
+def analyze_all(directory='Reviews', workers=1, mode='file', chunk_size=50, include_done=False, use_cache=True, file_format=None):
+    if not os.path.isdir(directory):
+        print(f"No {directory} directory to analyze.")
+        return []
+
+    file_paths = find_pending_files(directory, include_done=include_done)
+    if not file_paths:
+        print("No pending review files to analyze.")
+        return []
+
+    print(f"Analyzing {len(file_paths)} files with {workers} worker(s), split by {mode}...")
+    start = time.perf_counter()
+    total_reviews = 0
+    failed = []
+    store = SentimentStore()
+
+    try:
+        with ProcessPoolExecutor(max_workers=workers, initializer=init_worker) as executor:
+            if mode == 'file':
+                futures = {executor.submit(analyze_file, file_path, use_cache): file_path for file_path in file_paths}
+                analyzed = ((futures[future], future.result) for future in as_completed(futures))
+            else:
+                analyzed = ((file_path, functools.partial(analyze_reviews, file_path, chunk_size=chunk_size, executor=executor,
+                                                          use_cache=use_cache))
+                            for file_path in file_paths)
+
+            for file_path, analyze in analyzed:
+                try:
+                    sentiment_results, aggregated_scores, num_reviews, avg_rating, data, restaurant_url = analyze()
+                    save_sentiment_results(file_path, sentiment_results, aggregated_scores, num_reviews, avg_rating, data,
+                                           restaurant_url, file_format, store)
+                except Exception as e:
+                    print(f"Failed to analyze {file_path}: {e}")
+                    failed.append(file_path)
+                    continue
+                total_reviews += num_reviews
+                print(f"Analyzed {file_path}: {num_reviews} reviews, compound {aggregated_scores['compound']:.2f}")
+    finally:
+        store.export_csv()
+        store.close()
+
+    elapsed = time.perf_counter() - start
+    num_files = len(file_paths) - len(failed)
+    print(f"\nAnalyzed {total_reviews} reviews in {num_files} files in {elapsed:.1f} s "
+          f"({total_reviews / elapsed:.1f} reviews/s, {num_files / elapsed:.2f} files/s)")
+    if failed:
+        print(f"{len(failed)} file(s) could not be analyzed:")
+        for file_path in failed:
+            print(f"  {file_path}")
+    return failed
+
+
+# Let user select a review file to analyze
 def select_csv_file(directory='Reviews'):
-    csv_files = [f for f in os.listdir(directory) if f.endswith('.csv')]
+    csv_files = [f for f in os.listdir(directory) if is_table_file(f)]
 
     if not csv_files:
         print("No CSV files found in the directory.")
@@ -118,8 +341,10 @@ def select_csv_file(directory='Reviews'):
             print("Invalid input. Please enter a number.")
 
 
-# Save results to a CSV file
-def save_sentiment_results(original_file_path, sentiment_results, aggregated_scores, num_reviews, avg_rating, data, restaurant_url):
+# Save results to a sentiment file, in the format of the review file unless file_format is given, and to the sentiment store.
+# Without a store the default store is opened and the master file is exported right away.
+def save_sentiment_results(original_file_path, sentiment_results, aggregated_scores, num_reviews, avg_rating, data, restaurant_url,
+                           file_format=None, store=None):
     os.makedirs("Sentiments", exist_ok=True)
 
     results_data = []
@@ -132,7 +357,10 @@ def save_sentiment_results(original_file_path, sentiment_results, aggregated_sco
 
         results_data.append({
             'Review': review,
-            'Sentiment': str(sentiment),
+            'neg': sentiment['neg'],
+            'neu': sentiment['neu'],
+            'pos': sentiment['pos'],
+            'compound': sentiment['compound'],
             'Rating': rating,
             'Date': date,
             'BagOfWordsSize': len(text_features['bag_of_words']),
@@ -140,58 +368,117 @@ def save_sentiment_results(original_file_path, sentiment_results, aggregated_sco
         })
 
     results_df = pd.DataFrame(results_data)
+    if not results_df.empty:
+        results_df.insert(results_df.columns.get_loc('compound') + 1, 'Category', sentiment_categories(results_df['compound']))
+
+    restaurant_name = restaurant_file_name(original_file_path)
+    new_file_path = table_path(os.path.join("Sentiments", restaurant_name + '_sentiment'),
+                               file_format or table_format(original_file_path))
+    metadata = {'url': restaurant_url, 'reviews': num_reviews, 'analyzer_version': ANALYZER_VERSION,
+                'analyzed_at': datetime.datetime.now().isoformat(timespec='seconds')}
+    write_table(new_file_path, results_df, metadata)
 
-    original_file_name = os.path.basename(original_file_path)
-    base_file_name = os.path.splitext(original_file_name)[0]
-    new_file_name = base_file_name.replace('_reviews', '') + '_sentiment.csv'
-    new_file_path = os.path.join("Sentiments", new_file_name)
+    # Token index of the results, used by the dashboards for word clouds and search
+    indexed = results_df.reindex(columns=['Review', 'Date'])
+    TokenIndex.build(indexed['Review'].tolist(), review_months(indexed['Date'])).save(index_path(restaurant_name))
 
-    with open(new_file_path, mode='w', newline='', encoding='utf-8') as f:
-        f.write(f"{restaurant_url}\n")
-        results_df.to_csv(f, index=False)
+    # Aggregate cube of the results, rolled up by the dashboards instead of scanning the reviews
+    save_cube(build_cube(results_df), cube_path(restaurant_name))
 
     aggregated_scores_df = pd.DataFrame([aggregated_scores])
-    aggregated_file_name = base_file_name.replace('_reviews', '') + '_aggregated.csv'
+    aggregated_file_name = restaurant_name + '_aggregated.csv'
     aggregated_file_path = os.path.join("Sentiments", aggregated_file_name)
     aggregated_scores_df.to_csv(aggregated_file_path, index=False)
 
-    restaurant_name = base_file_name.replace('_reviews', '')
-    master_data = {
-        'Name': restaurant_name,
-        'URL': restaurant_url,
-        'Reviews': num_reviews,
-        'Rating': avg_rating,
-        'Positive': aggregated_scores['pos'],
-        'Neutral': aggregated_scores['neu'],
-        'Negative': aggregated_scores['neg'],
-        'Compound': aggregated_scores['compound']
-    }
-
-    update_master_sentiment_csv(master_data)
-
-
-# Function to update master sentiment CSV
-def update_master_sentiment_csv(master_data):
-    master_file_path = "Sentiments/master_sentiment.csv"
+    own_store = store is None
+    if own_store:
+        store = SentimentStore()
+    try:
+        # Results of an earlier scrape of the restaurant, saved under its old review count, are replaced by these
+        replaced = superseded_restaurants(restaurant_name, set(store.restaurants()['Name']) | set(restaurant_names()))
+        store.save_restaurant(restaurant_name, restaurant_url, num_reviews, avg_rating, aggregated_scores, results_df,
+                              replaced)
+        if own_store:
+            store.export_csv()
+    finally:
+        if own_store:
+            store.close()
+
+    for name in replaced:
+        remove_sentiment_results(name)
+        print(f"Removed the results of {name}, replaced by {restaurant_name}")
+
+
+# Delete the sentiment, aggregated, token index and cube files of a restaurant
+def remove_sentiment_results(restaurant_name):
+    base_path = os.path.join("Sentiments", restaurant_name)
+    paths = [table_path(base_path + '_sentiment', file_format) for file_format in FORMATS]
+    paths += [base_path + '_aggregated.csv', index_path(restaurant_name), cube_path(restaurant_name)]
+    for path in paths:
+        if os.path.exists(path):
+            os.remove(path)
+
+
+# Time the analysis with the models reloaded for every review, as it used to run, against one shared engine
+def benchmark_engine(file_path, sample=100):
+    reviews, _, _ = load_reviews_from_csv(file_path)
+    reviews = [review for review in reviews if isinstance(review, str) and review.strip()][:sample]
+    if not reviews:
+        print("No reviews to benchmark.")
+        return
+
+    start = time.perf_counter()
+    for review in reviews:
+        SentimentIntensityAnalyzer().polarity_scores(review)
+        stop_words = set(stopwords.words('english'))
+        tokens = [t.lower() for t in word_tokenize(review) if t.isalpha()]
+        ne_chunk(pos_tag([t for t in tokens if t not in stop_words and len(t) > 2]))
+    reload_time = (time.perf_counter() - start) / len(reviews)
 
-    if os.path.exists(master_file_path):
-        master_df = pd.read_csv(master_file_path)
-        master_df = pd.concat([master_df, pd.DataFrame([master_data])], ignore_index=True)
-    else:
-        columns = ['Name', 'URL', 'Reviews', 'Rating', 'Positive', 'Neutral', 'Negative', 'Compound']
-        master_df = pd.DataFrame([master_data], columns=columns)
+    start = time.perf_counter()
+    engine = SentimentEngine()
+    load_time = time.perf_counter() - start
 
-    master_df.to_csv(master_file_path, index=False)
+    start = time.perf_counter()
+    for review in reviews:
+        engine.analyze_sentiment(review)
+        engine.process_text(review)
+    engine_time = (time.perf_counter() - start) / len(reviews)
+
+    print(f"Benchmarked {len(reviews)} reviews from {file_path}")
+    print(f"Models reloaded per review: {reload_time * 1000:.2f} ms/review")
+    print(f"Shared engine: {engine_time * 1000:.2f} ms/review (plus {load_time * 1000:.0f} ms to load once)")
+    print(f"Speedup: {reload_time / engine_time:.1f}x")
+
+
+# Parse the command line options
+def parse_args():
+    parser = argparse.ArgumentParser(description="Analyze the sentiment of scraped reviews.")
+    parser.add_argument('--benchmark', metavar='CSV', help="time the shared analysis engine on a review file")
+    parser.add_argument('--batch', action='store_true', help="analyze every pending file in Reviews/ without prompting")
+    parser.add_argument('--mode', choices=['file', 'review'], default='file',
+                        help="split the batch across workers by file or by review")
+    parser.add_argument('--all', action='store_true', help="also re-analyze files that are already up to date")
+    parser.add_argument('--no-cache', action='store_true', help="score every review again instead of reusing cached results")
+    parser.add_argument('--format', choices=sorted(FORMATS),
+                        help="storage format of the sentiment files (default: same as the review file)")
+    parser.add_argument('--export-master', action='store_true',
+                        help="write Sentiments/master_sentiment.csv from the sentiment store and exit")
+    parser.add_argument('--sample', type=int, default=100, help="number of reviews to benchmark")
+    parser.add_argument('--workers', type=int, default=1, help="worker processes analyzing the reviews")
+    parser.add_argument('--chunk-size', type=int, default=50, help="reviews sent to a worker at a time")
+    return parser.parse_args()
 
 
 # Main function
-def main():
+def main(workers=1, chunk_size=50, use_cache=True, file_format=None):
     while True:
         file_path = select_csv_file()
 
         if file_path:
             print(f"Analyzing {file_path}...\n")
-            sentiment_results, aggregated_scores, num_reviews, avg_rating, data, restaurant_url = analyze_reviews(file_path)
+            sentiment_results, aggregated_scores, num_reviews, avg_rating, data, restaurant_url = analyze_reviews(
+                file_path, workers=workers, chunk_size=chunk_size, use_cache=use_cache)
 
             for result in sentiment_results:
                 print(f"Review: {result['Review']}")
@@ -204,7 +491,8 @@ def main():
             print(f"Positive: {aggregated_scores['pos']:.2f}")
             print(f"Compound: {aggregated_scores['compound']:.2f}")
 
-            save_sentiment_results(file_path, sentiment_results, aggregated_scores, num_reviews, avg_rating, data, restaurant_url)
+            save_sentiment_results(file_path, sentiment_results, aggregated_scores, num_reviews, avg_rating, data, restaurant_url,
+                                   file_format)
 
         while True:
             choice = input("\nWould you like to analyze another file? (y/n): ").strip().lower()
@@ -219,4 +507,20 @@ def main():
 
 # Run the program
 if __name__ == "__main__":
-    main()
+    download_nltk_resources()
+    if len(sys.argv) > 1:
+        args = parse_args()
+        if args.export_master:
+            store = SentimentStore()
+            print(f"Exported {store.export_csv()}")
+            store.close()
+        elif args.benchmark:
+            benchmark_engine(args.benchmark, args.sample)
+        elif args.batch:
+            failed = analyze_all(workers=args.workers, mode=args.mode, chunk_size=args.chunk_size, include_done=args.all,
+                                 use_cache=not args.no_cache, file_format=args.format)
+            sys.exit(1 if failed else 0)
+        else:
+            main(args.workers, args.chunk_size, not args.no_cache, args.format)
+    else:
+        main()
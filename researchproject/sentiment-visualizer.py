@@ -1,13 +1,13 @@
 import os
-import pandas as pd
 import matplotlib.pyplot as plt
 from wordcloud import WordCloud
+from storage import is_table_file, read_sentiment_file
 
 
 # Load sentiment results from CSV files in the Sentiments directory
 def load_sentiment_results(directory='Sentiments'):
     # List all sentiment result CSV files in the specified directory
-    csv_files = [f for f in os.listdir(directory) if f.endswith('_sentiment.csv')]
+    csv_files = [f for f in os.listdir(directory) if is_table_file(f, '_sentiment')]
 
     if not csv_files:
         print("No sentiment result CSV files found in the directory.")
@@ -18,14 +18,9 @@ def load_sentiment_results(directory='Sentiments'):
 
 # Plot sentiment results
 def plot_sentiment(results_df, restaurant_name):
-    # Assuming the results DataFrame has a 'Sentiment' column with dictionary-like strings
+    # The results DataFrame has one numeric column per sentiment score
     sentiment_labels = ['Negative', 'Neutral', 'Positive', 'Compound']
-    sentiment_values = [
-        results_df['Sentiment'].apply(lambda x: eval(x)['neg']).mean(),
-        results_df['Sentiment'].apply(lambda x: eval(x)['neu']).mean(),
-        results_df['Sentiment'].apply(lambda x: eval(x)['pos']).mean(),
-        results_df['Sentiment'].apply(lambda x: eval(x)['compound']).mean(),
-    ]
+    sentiment_values = results_df[['neg', 'neu', 'pos', 'compound']].mean().tolist()
 
     # Create a bar plot for sentiment scores
     plt.figure(figsize=(10, 6))
@@ -57,7 +52,7 @@ def generate_word_cloud(reviews):
 # Let user select a CSV file to visualize
 def select_csv_file(directory='Sentiments'):
     # List all sentiment result CSV files in the specified directory
-    csv_files = [f for f in os.listdir(directory) if f.endswith('_sentiment.csv')]
+    csv_files = [f for f in os.listdir(directory) if is_table_file(f, '_sentiment')]
 
     if not csv_files:
         print("No sentiment result CSV files found in the directory.")
@@ -89,7 +84,7 @@ def main():
         print(f"Loading {file_path} for visualization...")
 
         # Load the sentiment analysis results
-        results_df = pd.read_csv(file_path)
+        results_df, _ = read_sentiment_file(file_path)
 
         # Extract the restaurant name from the file name
         restaurant_name = os.path.basename(file_path).split('_sentiment')[0]
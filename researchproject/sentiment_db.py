@@ -0,0 +1,195 @@
+import os
+import re
+import sqlite3
+import datetime
+import pandas as pd
+from storage import find_table, is_table_file, read_sentiment_file
+
+DEFAULT_PATH = os.path.join('Sentiments', 'sentiments.sqlite')
+
+# Columns of the master file exported for compatibility, and the restaurants columns they come from
+MASTER_COLUMNS = {'Name': 'name', 'URL': 'url', 'Reviews': 'reviews', 'Rating': 'rating', 'Positive': 'positive',
+                  'Neutral': 'neutral', 'Negative': 'negative', 'Compound': 'compound'}
+REVIEW_COLUMNS = ['Review', 'neg', 'neu', 'pos', 'compound', 'Category', 'Rating', 'Date', 'BagOfWordsSize',
+                  'NamedEntitiesCount']
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS restaurants (
+    name TEXT PRIMARY KEY,
+    url TEXT,
+    reviews INTEGER,
+    rating REAL,
+    positive REAL,
+    neutral REAL,
+    negative REAL,
+    compound REAL,
+    analyzed_at TEXT
+);
+CREATE TABLE IF NOT EXISTS reviews (
+    restaurant TEXT NOT NULL REFERENCES restaurants (name) ON DELETE CASCADE,
+    position INTEGER NOT NULL,
+    Review TEXT,
+    neg REAL,
+    neu REAL,
+    pos REAL,
+    compound REAL,
+    Category TEXT,
+    Rating REAL,
+    Date TEXT,
+    BagOfWordsSize INTEGER,
+    NamedEntitiesCount INTEGER,
+    PRIMARY KEY (restaurant, position)
+) WITHOUT ROWID;
+CREATE INDEX IF NOT EXISTS reviews_by_date ON reviews (restaurant, Date);
+"""
+
+
+class SentimentStore:
+    """SQLite store of the analyzed restaurants and their per-review results, keyed by restaurant name
+    (the name of the sentiment file without '_sentiment'). Re-analyzing a restaurant replaces its rows,
+    and can delete those saved under the review count of an earlier scrape (see superseded_restaurants).
+    The database runs in WAL mode, so readers never block the writer, and concurrent writers wait
+    up to timeout seconds for each other instead of failing."""
+
+    def __init__(self, path=DEFAULT_PATH, timeout=60):
+        os.makedirs(os.path.dirname(path) or '.', exist_ok=True)
+        self.connection = sqlite3.connect(path, timeout=timeout, isolation_level=None)
+        self.connection.execute("PRAGMA journal_mode=WAL")
+        self.connection.execute("PRAGMA synchronous=NORMAL")
+        self.connection.execute("PRAGMA foreign_keys=ON")
+        self.connection.executescript(SCHEMA)
+
+    def save_restaurant(self, name, url, num_reviews, avg_rating, aggregated_scores, results_df, replaces=()):
+        """Insert or replace the aggregates and the review results of a restaurant in one transaction,
+        deleting the restaurants it replaces in the same transaction"""
+        reviews = results_df.reindex(columns=REVIEW_COLUMNS).astype(object)
+        reviews = reviews.where(reviews.notna(), None)
+        rows = ((name, position, *values) for position, values in enumerate(reviews.itertuples(index=False, name=None)))
+
+        # BEGIN IMMEDIATE takes the write lock up front, so two writers cannot deadlock on a lock upgrade
+        self.connection.execute("BEGIN IMMEDIATE")
+        try:
+            self.connection.executemany("DELETE FROM restaurants WHERE name = ?",
+                                        ((replaced,) for replaced in replaces if replaced != name))
+            self.connection.execute(
+                "INSERT INTO restaurants (name, url, reviews, rating, positive, neutral, negative, compound, analyzed_at) "
+                "VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?) "
+                "ON CONFLICT (name) DO UPDATE SET url = excluded.url, reviews = excluded.reviews, rating = excluded.rating, "
+                "positive = excluded.positive, neutral = excluded.neutral, negative = excluded.negative, "
+                "compound = excluded.compound, analyzed_at = excluded.analyzed_at",
+                (name, url, int(num_reviews), None if pd.isna(avg_rating) else float(avg_rating),
+                 aggregated_scores['pos'], aggregated_scores['neu'], aggregated_scores['neg'], aggregated_scores['compound'],
+                 datetime.datetime.now().isoformat()))
+            self.connection.execute("DELETE FROM reviews WHERE restaurant = ?", (name,))
+            self.connection.executemany(
+                f"INSERT INTO reviews (restaurant, position, {', '.join(REVIEW_COLUMNS)}) "
+                f"VALUES ({', '.join('?' * (len(REVIEW_COLUMNS) + 2))})", rows)
+            self.connection.execute("COMMIT")
+        except BaseException:
+            self.connection.execute("ROLLBACK")
+            raise
+
+    def restaurants(self):
+        """Return the aggregates of every restaurant, one row each, with the columns of the master file"""
+        query = f"SELECT {', '.join(f'{column} AS {name}' for name, column in MASTER_COLUMNS.items())} FROM restaurants ORDER BY name"
+        return pd.read_sql_query(query, self.connection)
+
+    def restaurant_url(self, name):
+        """Return the URL of a restaurant, or None if it is not in the store"""
+        row = self.connection.execute("SELECT url FROM restaurants WHERE name = ?", (name,)).fetchone()
+        return row[0] if row else None
+
+    def reviews(self, name, columns=None):
+        """Return the review results of a restaurant in their original order, or None if it is not in the store"""
+        if not self.has_restaurant(name):
+            return None
+        columns = [column for column in (columns or REVIEW_COLUMNS) if column in REVIEW_COLUMNS]
+        query = f"SELECT {', '.join(columns)} FROM reviews WHERE restaurant = ? ORDER BY position"
+        return pd.read_sql_query(query, self.connection, params=(name,))
+
+    def analyzed_at(self, name):
+        """Return when a restaurant was last saved, or None if it is not in the store"""
+        row = self.connection.execute("SELECT analyzed_at FROM restaurants WHERE name = ?", (name,)).fetchone()
+        return row[0] if row else None
+
+    def has_restaurant(self, name):
+        """Whether the restaurant has been saved to the store"""
+        return self.connection.execute("SELECT 1 FROM restaurants WHERE name = ?", (name,)).fetchone() is not None
+
+    def export_csv(self, path=os.path.join('Sentiments', 'master_sentiment.csv')):
+        """Write the restaurant aggregates to a CSV file laid out like the old master file"""
+        temp_path = f"{path}.tmp"
+        self.restaurants().to_csv(temp_path, index=False)
+        os.replace(temp_path, path)
+        return path
+
+    def close(self):
+        self.connection.close()
+
+
+def restaurant_names(directory='Sentiments', path=DEFAULT_PATH):
+    """List the restaurants in the store, plus those only found as sentiment files in the directory"""
+    names = set()
+    if os.path.exists(path):
+        store = SentimentStore(path)
+        try:
+            names.update(store.restaurants()['Name'])
+        finally:
+            store.close()
+    if os.path.isdir(directory):
+        names.update(os.path.splitext(f)[0][:-len('_sentiment')] for f in os.listdir(directory)
+                     if is_table_file(f, '_sentiment'))
+    names.discard('master')  # master_sentiment.csv is the exported aggregates, not a restaurant
+    return sorted(names)
+
+
+def load_sentiment(name, columns=None, directory='Sentiments', path=DEFAULT_PATH):
+    """Load the review results and URL of a restaurant from the store, falling back to its sentiment file"""
+    if os.path.exists(path):
+        store = SentimentStore(path)
+        try:
+            if store.has_restaurant(name):
+                return store.reviews(name, columns), store.restaurant_url(name)
+        finally:
+            store.close()
+
+    file_path = find_table(os.path.join(directory, name + '_sentiment'))
+    if file_path is None:
+        raise FileNotFoundError(f"No sentiment results for {name}")
+    return read_sentiment_file(file_path, columns)
+
+
+def sentiment_version(name, directory='Sentiments', path=DEFAULT_PATH):
+    """Return a key that changes whenever the results load_sentiment returns for the restaurant change:
+    its save time in the store, or else the path and mtime of its sentiment file"""
+    if os.path.exists(path):
+        store = SentimentStore(path)
+        try:
+            analyzed_at = store.analyzed_at(name)
+        finally:
+            store.close()
+        if analyzed_at is not None:
+            return path, analyzed_at
+
+    file_path = find_table(os.path.join(directory, name + '_sentiment'))
+    return (file_path, os.path.getmtime(file_path)) if file_path else None
+
+
+def superseded_restaurants(name, names):
+    """Return the restaurants among names that hold earlier results of the same restaurant and sort as name.
+    Review files are named after the restaurant, the sort and the review count ('place_new_20'), so an
+    incremental scrape that adds reviews renames the file ('place_new_27') and its results get a new name."""
+    match = re.fullmatch(r"(.+_(?:new|popular))_\d+", name)
+    if match is None:
+        return []
+    pattern = re.compile(rf"{re.escape(match.group(1))}_\d+")
+    return sorted(other for other in names if other != name and pattern.fullmatch(other))
+
+
+def results_version(directory='Sentiments'):
+    """Return a key that changes whenever any restaurant is analyzed: the number and latest modification time
+    of the files in the results directory, leaving out the files SQLite keeps next to an open database"""
+    if not os.path.isdir(directory):
+        return None
+    entries = [entry for entry in os.scandir(directory) if not entry.name.endswith(('-wal', '-shm', '-journal'))]
+    return len(entries), max((entry.stat().st_mtime for entry in entries), default=None)
@@ -0,0 +1,148 @@
+import os
+import ast
+import json
+import numpy as np
+import pandas as pd
+
+try:
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+except ImportError:  # Parquet storage is optional, CSV works without pyarrow
+    pa = pq = None
+
+SENTIMENT_SCORES = ['neg', 'neu', 'pos', 'compound']
+
+# Review and sentiment files are written as CSV with the restaurant URL on the first line,
+# or as zstd-compressed Parquet with the URL and the run details in the file metadata
+FORMATS = {'csv': '.csv', 'parquet': '.parquet'}
+DEFAULT_FORMAT = os.environ.get('REVIEW_STORAGE_FORMAT', 'csv')
+METADATA_KEY = b'researchproject'
+
+
+def table_format(file_path):
+    """Return the storage format of a file from its extension"""
+    return 'parquet' if file_path.endswith(FORMATS['parquet']) else 'csv'
+
+
+def is_table_file(file_name, suffix=''):
+    """Whether the file is a review or sentiment file in any format, with the given name suffix"""
+    return any(file_name.endswith(suffix + extension) for extension in FORMATS.values())
+
+
+def table_path(base_path, file_format=None):
+    """Return the path of a table file given its path without extension"""
+    return base_path + FORMATS[file_format or DEFAULT_FORMAT]
+
+
+def find_table(base_path):
+    """Return the existing table file with the path without extension, in any format, or None"""
+    paths = [base_path + extension for extension in FORMATS.values() if os.path.exists(base_path + extension)]
+    return max(paths, key=os.path.getmtime) if paths else None
+
+
+def require_pyarrow():
+    if pq is None:
+        raise RuntimeError("Parquet storage needs pyarrow: pip install pyarrow")
+
+
+def remove_other_formats(file_path):
+    """Delete the copies of a table in the other formats, so a rewritten table is never listed twice"""
+    base_path = os.path.splitext(file_path)[0]
+    for extension in FORMATS.values():
+        if base_path + extension != file_path and os.path.exists(base_path + extension):
+            os.remove(base_path + extension)
+
+
+def read_table(file_path, columns=None):
+    """Load a table file, returning the frame and its metadata.
+    Only the listed columns are read; columns missing from the file are skipped."""
+    if table_format(file_path) == 'parquet':
+        require_pyarrow()
+        parquet_file = pq.ParquetFile(file_path)
+        if columns is not None:
+            columns = [name for name in parquet_file.schema_arrow.names if name in columns]
+        metadata = parquet_file.schema_arrow.metadata or {}
+        return parquet_file.read(columns=columns).to_pandas(), json.loads(metadata.get(METADATA_KEY, b'{}'))
+
+    with open(file_path, encoding='utf-8') as file:
+        metadata = {'url': file.readline().strip()}
+        usecols = None if columns is None else (lambda name: name in columns)
+        return pd.read_csv(file, usecols=usecols, keep_default_na=False, na_values=['']), metadata
+
+
+def iter_table_chunks(file_path, chunk_size=10000):
+    """Yield the rows of a table file as frames of up to chunk_size rows"""
+    if table_format(file_path) == 'parquet':
+        require_pyarrow()
+        for batch in pq.ParquetFile(file_path).iter_batches(batch_size=chunk_size):
+            yield batch.to_pandas()
+        return
+
+    with open(file_path, encoding='utf-8') as file:
+        file.readline()  # Restaurant URL
+        yield from pd.read_csv(file, chunksize=chunk_size, keep_default_na=False, na_values=[''])
+
+
+def write_table(file_path, chunks, metadata):
+    """Write frames one after the other to a single table file, in the format of its extension.
+    Only one frame is held in memory at a time. The file is written next to its final path and moved
+    into place at the end, replacing any copy of the table in another format."""
+    if isinstance(chunks, pd.DataFrame):
+        chunks = [chunks]
+    temp_path = f"{file_path}.tmp"
+
+    if table_format(file_path) == 'parquet':
+        require_pyarrow()
+        writer = None
+        try:
+            for chunk in chunks:
+                table = pa.Table.from_pandas(chunk, preserve_index=False)
+                if writer is None:
+                    schema = table.schema.with_metadata({METADATA_KEY: json.dumps(metadata).encode('utf-8')})
+                    writer = pq.ParquetWriter(temp_path, schema, compression='zstd')
+                writer.write_table(table.cast(schema))
+        finally:
+            if writer is not None:
+                writer.close()
+        if writer is None:
+            return None
+    else:
+        with open(temp_path, 'w', encoding='utf-8', newline='') as file:
+            file.write(f"{metadata.get('url', '')}\n")
+            for index, chunk in enumerate(chunks):
+                chunk.to_csv(file, index=False, header=index == 0)
+
+    os.replace(temp_path, file_path)
+    remove_other_formats(file_path)
+    return file_path
+
+
+def sentiment_categories(compound):
+    """Label compound scores as Positive (> 0), Neutral (= 0) or Negative (< 0)"""
+    return np.select([compound > 0, compound < 0], ['Positive', 'Negative'], default='Neutral')
+
+
+def migrate_sentiment_columns(df):
+    """Give sentiment frames written before the scores had their own columns the numeric score
+    columns and the Category column, parsing the old stringified 'Sentiment' dicts once"""
+    if 'Sentiment' in df.columns and 'compound' not in df.columns:
+        parsed = [ast.literal_eval(value) if isinstance(value, str) else {} for value in df['Sentiment']]
+        scores = pd.DataFrame(parsed, index=df.index).reindex(columns=SENTIMENT_SCORES).astype(float)
+        position = df.columns.get_loc('Sentiment')
+        df = pd.concat([df.iloc[:, :position], scores, df.iloc[:, position + 1:]], axis=1)
+
+    if 'Category' not in df.columns and 'compound' in df.columns:
+        df.insert(df.columns.get_loc('compound') + 1, 'Category', sentiment_categories(df['compound']))
+
+    return df
+
+
+def read_sentiment_file(file_path, columns=None):
+    """Load a sentiment file in any format, returning the frame and the restaurant URL.
+    With columns set only those columns are read (plus what old files need to derive them)."""
+    needed = None if columns is None else set(columns) | {'compound', 'Sentiment'}
+    df, metadata = read_table(file_path, needed)
+    df = migrate_sentiment_columns(df)
+    if columns is not None:
+        df = df[[name for name in columns if name in df.columns]]
+    return df, metadata.get('url')
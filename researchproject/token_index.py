@@ -0,0 +1,149 @@
+import os
+import re
+from collections import Counter
+import numpy as np
+import pandas as pd
+from wordcloud import STOPWORDS
+
+# Same tokens as the word clouds: runs of word characters and apostrophes, two characters or more
+word_pattern = re.compile(r"\w[\w']+")
+piece_pattern = re.compile(r"\w+")
+
+
+def index_path(name, directory='Sentiments'):
+    """Return the token index file of a restaurant, next to its sentiment file"""
+    return os.path.join(directory, f"{name}_tokens.npz")
+
+
+class TokenIndex:
+    """Token counts of the reviews of a restaurant, built once at analysis time.
+    Reviews are identified by their position in the sentiment results. The index holds the
+    term frequencies of every review, an inverted index from term to the reviews using it,
+    and the term counts of every month, all as flat numpy arrays."""
+
+    def __init__(self, terms, num_reviews, rows, term_ids, counts, months, month_ids, month_terms, month_counts):
+        self.terms = terms                  # Vocabulary, in lower case
+        self.term_list = terms.tolist()
+        self.num_reviews = num_reviews
+        self.rows = rows                    # Term frequencies per review: (review, term, count) entries sorted by review
+        self.term_ids = term_ids
+        self.counts = counts
+        self.months = months                # Month-Year labels
+        self.month_ids = month_ids          # Term counts per month: (month, term, count) entries
+        self.month_terms = month_terms
+        self.month_counts = month_counts
+
+        # Inverted index: the reviews of term t are postings[postings_start[t]:postings_start[t + 1]]
+        order = np.argsort(term_ids, kind='stable')
+        self.postings = rows[order]
+        self.postings_start = np.searchsorted(term_ids[order], np.arange(len(terms) + 1))
+
+        # Word cloud words of every term ('s dropped, stopwords and numbers left out as -1)
+        words = [term[:-2] if term.endswith("'s") else term for term in self.term_list]
+        kept = sorted({word for word in words if word not in STOPWORDS and not word.isdigit()})
+        word_ids = {word: i for i, word in enumerate(kept)}
+        self.words = np.array(kept, dtype=str)
+        self.word_of_term = np.array([word_ids.get(word, -1) for word in words], dtype=np.int64)
+
+    @property
+    def nbytes(self):
+        arrays = (self.terms, self.rows, self.term_ids, self.counts, self.month_ids, self.month_terms,
+                  self.month_counts, self.postings, self.postings_start, self.words, self.word_of_term)
+        return sum(array.nbytes for array in arrays)
+
+    @classmethod
+    def build(cls, reviews, months):
+        """Tokenize the reviews once, given the Month-Year label of every review"""
+        vocabulary = {}
+        rows, term_ids, counts = [], [], []
+        for position, review in enumerate(reviews):
+            if not isinstance(review, str):
+                continue
+            for term, count in Counter(word_pattern.findall(review.lower())).items():
+                rows.append(position)
+                term_ids.append(vocabulary.setdefault(term, len(vocabulary)))
+                counts.append(count)
+
+        rows = np.array(rows, dtype=np.int64)
+        term_ids = np.array(term_ids, dtype=np.int64)
+        counts = np.array(counts, dtype=np.int64)
+        month_labels, month_of_review = np.unique(np.asarray(months, dtype=str), return_inverse=True)
+
+        # Sum the counts of every (month, term) pair
+        month_keys = month_of_review[rows] * max(len(vocabulary), 1) + term_ids
+        unique_keys, inverse = np.unique(month_keys, return_inverse=True)
+        month_counts = np.bincount(inverse, weights=counts).astype(np.int64)
+        month_ids, month_terms = np.divmod(unique_keys, max(len(vocabulary), 1))
+
+        return cls(np.array(list(vocabulary), dtype=str), len(month_of_review), rows, term_ids, counts,
+                   month_labels, month_ids, month_terms, month_counts)
+
+    def save(self, path):
+        temp_path = f"{path}.tmp.npz"
+        np.savez_compressed(temp_path, terms=self.terms, num_reviews=self.num_reviews, rows=self.rows,
+                            term_ids=self.term_ids, counts=self.counts, months=self.months, month_ids=self.month_ids,
+                            month_terms=self.month_terms, month_counts=self.month_counts)
+        os.replace(temp_path, path)
+        return path
+
+    @classmethod
+    def load(cls, path):
+        """Load a saved index, or return None if it is missing or unreadable"""
+        try:
+            with np.load(path, allow_pickle=False) as data:
+                return cls(data['terms'], int(data['num_reviews']), data['rows'], data['term_ids'], data['counts'],
+                           data['months'], data['month_ids'], data['month_terms'], data['month_counts'])
+        except (OSError, KeyError, ValueError):
+            return None
+
+    def word_counts(self, term_ids, counts):
+        """Turn term counts into the word counts of a word cloud"""
+        words = self.word_of_term[term_ids]
+        kept = words >= 0
+        totals = np.bincount(words[kept], weights=counts[kept], minlength=len(self.words))
+        nonzero = np.flatnonzero(totals)
+        return dict(zip(self.words[nonzero].tolist(), totals[nonzero].astype(np.int64).tolist()))
+
+    def review_frequencies(self, positions):
+        """Sum the word counts of the reviews at the given positions"""
+        selected = np.zeros(self.num_reviews, dtype=bool)
+        selected[np.asarray(positions, dtype=np.int64)] = True
+        entries = selected[self.rows]
+        return self.word_counts(self.term_ids[entries], self.counts[entries])
+
+    def month_frequencies(self, months=None):
+        """Sum the word counts of the given months (all of them if None) from the monthly counts"""
+        if months is None:
+            entries = slice(None)
+        else:
+            entries = np.isin(self.months[self.month_ids], list(months))
+        return self.word_counts(self.month_terms[entries], self.month_counts[entries])
+
+    def search(self, query):
+        """Return the positions of the reviews that may contain the query, or None if the index cannot tell.
+        A review can only contain the query if, for every word of two characters or more in the query,
+        one of its terms contains that word. The candidates still have to be checked against the text."""
+        pieces = [piece for piece in piece_pattern.findall(query.lower()) if len(piece) > 1]
+        if not pieces:
+            return None
+
+        candidates = None
+        for piece in pieces:
+            matching = [i for i, term in enumerate(self.term_list) if piece in term]
+            if not matching:
+                return np.array([], dtype=np.int64)
+            postings = np.unique(np.concatenate([self.postings[self.postings_start[i]:self.postings_start[i + 1]]
+                                                 for i in matching]))
+            candidates = postings if candidates is None else np.intersect1d(candidates, postings, assume_unique=True)
+        return candidates
+
+
+def review_months(dates):
+    """Return the Month-Year label of every review date, as the dashboards compute it"""
+    return pd.to_datetime(dates, errors='coerce').dt.to_period('M').astype(str)
+
+
+def load_token_index(name, num_reviews, directory='Sentiments'):
+    """Load the token index of a restaurant, or None if it is missing or does not match its num_reviews results"""
+    index = TokenIndex.load(index_path(name, directory))
+    return index if index is not None and index.num_reviews == num_reviews else None
@@ -0,0 +1,94 @@
+import re
+import base64
+from io import BytesIO
+from collections import Counter
+import diskcache
+import pandas as pd
+from PIL import Image
+from wordcloud import WordCloud, STOPWORDS
+
+# Same tokens as WordCloud.process_text, without its collocation pass
+word_pattern = re.compile(r"\w[\w']+")
+MAX_WORDS = 200
+
+# Word counts are cached per sentiment category and month, the cells of the aggregate cube
+GROUP_COLUMNS = ['Category', 'Month-Year']
+
+
+def word_frequencies(reviews):
+    """Count the words of the reviews in lower case, leaving out stopwords and numbers"""
+    text = ' '.join(review for review in reviews if isinstance(review, str)).lower()
+    counts = Counter()
+    for word, count in Counter(word_pattern.findall(text)).items():
+        if word.endswith("'s"):
+            word = word[:-2]
+        if word not in STOPWORDS and not word.isdigit():
+            counts[word] += count
+    return counts
+
+
+def render_png(frequencies, width, height):
+    """Draw the most frequent words straight to a PNG data URI, or a blank image if there are none"""
+    words = dict(Counter(frequencies).most_common(MAX_WORDS))
+    if words:
+        image = WordCloud(width=width, height=height, background_color='white', max_words=MAX_WORDS)\
+            .generate_from_frequencies(words).to_image()
+    else:
+        image = Image.new('RGB', (width, height), 'white')
+    buffer = BytesIO()
+    image.save(buffer, format='PNG')
+    return f"data:image/png;base64,{base64.b64encode(buffer.getvalue()).decode()}"
+
+
+def count_groups(df, groups, index=None):
+    """Count the words of the reviews of df in each of the given (category, month) groups, summed from the
+    token index when there is one. df needs the GROUP_COLUMNS, and the Review column if there is no index."""
+    rows = df[pd.MultiIndex.from_frame(df[GROUP_COLUMNS]).isin(groups)]
+    if index is not None:
+        count = lambda frame: Counter(index.review_frequencies(frame.index.to_numpy()))
+    else:
+        count = lambda frame: word_frequencies(frame['Review'].tolist())
+    return {group: count(frame) for group, frame in rows.groupby(GROUP_COLUMNS, sort=False)}
+
+
+def cell_groups(cells):
+    """Return the (category, month) groups of the aggregate cube cells that hold reviews"""
+    return list(cells.loc[cells['Reviews'] > 0, GROUP_COLUMNS].drop_duplicates().itertuples(index=False, name=None))
+
+
+class WordCloudService:
+    """On-disk caches of rendered word clouds and of the word counts behind them, shared by every background job
+    and dashboard process in one store bounded by size_limit, which evicts the least recently used entries.
+    Images are keyed by whatever identifies their reviews (restaurant, results version, filters) and their size,
+    so analyzing one restaurant leaves the images of the others cached. Word counts are kept per source
+    (restaurant and results version) and group of its reviews (sentiment category and month, the cells of its
+    aggregate cube), so word clouds whose filters overlap only count the groups they do not share, and a job
+    only loads the reviews when some group was never counted."""
+
+    def __init__(self, directory, size_limit=512 * 1024 * 1024):
+        self.cache = diskcache.Cache(directory, size_limit=size_limit, eviction_policy='least-recently-used')
+
+    def render(self, key, width, height, frequencies):
+        """Return the word cloud of the key as a PNG data URI, calling frequencies() to draw it on a miss"""
+        key = ('image', key, width, height)
+        image = self.cache.get(key)
+        if image is None:
+            image = render_png(frequencies(), width, height)
+            self.cache.set(key, image)
+        return image
+
+    def group_frequencies(self, source, groups, count_missing):
+        """Sum the word counts of the given groups of the source, calling count_missing(groups) for a dict
+        of the counts of the groups not cached yet"""
+        cached = {group: self.cache.get(('words', source, group)) for group in groups}
+        missing = [group for group, counts in cached.items() if counts is None]
+        if missing:
+            counted = count_missing(missing)
+            for group in missing:
+                cached[group] = counted.get(group, Counter())
+                self.cache.set(('words', source, group), cached[group])
+
+        total = Counter()
+        for counts in cached.values():
+            total.update(counts)
+        return total
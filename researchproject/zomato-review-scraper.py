@@ -1,15 +1,48 @@
 import os
+import sys
+import shutil
+import html
 import json
+import time
+import asyncio
+import argparse
+import functools
+import itertools
+import threading
 import requests
 import pandas as pd
 from bs4 import BeautifulSoup
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from requests.adapters import HTTPAdapter
 from requests.exceptions import RequestException, Timeout
+from urllib.parse import urlsplit
 from datetime import datetime, timedelta
+from page_cache import PageCache
+from rate_limiter import RateLimiter, RetryPolicy, parse_retry_after
+from storage import DEFAULT_FORMAT, FORMATS, iter_table_chunks, read_table, table_format, table_path, write_table
 import re
 
 headers = {
     'User-Agent': 'Mozilla/5.0 (Macintosh; Intel Mac OS X 10_15_4) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/83.0.4103.97 Safari/537.36'}
 
+# Markup the reviews are extracted from
+TIME_STAMP_CLASS = 'sc-1hez2tp-0 fKvqMN time-stamp'
+ld_json_pattern = re.compile(r'<script\b[^>]*\btype=["\']application/ld\+json["\'][^>]*>(.*?)</script>', re.S | re.I)
+time_stamp_pattern = re.compile(rf'<p\b[^>]*\bclass=["\']{re.escape(TIME_STAMP_CLASS)}["\'][^>]*>(.*?)</p>', re.S | re.I)
+tag_pattern = re.compile(r'<[^>]*>')
+
+REVIEW_COLUMNS = ['Author', 'Review URL', 'Description', 'Rating', 'Date']
+
+# Responses worth retrying, and the ones telling us to slow down
+RETRY_STATUSES = {429, 500, 502, 503, 504}
+THROTTLE_STATUSES = {429, 503}
+default_retry = RetryPolicy()
+
+# One semaphore per host and cap, shared by every scrape running in this process
+host_slots = {}
+host_slots_lock = threading.Lock()
+
 
 def convert_relative_time(relative_time):
     """Converts relative time (e.g., 'Yesterday', '19 hours ago', 'one month ago') to an absolute date."""
@@ -51,34 +84,115 @@ def convert_relative_time(relative_time):
     return "N/A"
 
 
+def build_review_rows(reviews, relative_dates):
+    """Builds the review rows from the reviews JSON and the relative dates shown on the page"""
+    data = []
+    for i, review in enumerate(reviews):
+        # Take the relative date from the matching <p> tag
+        relative_date = relative_dates[i] if i < len(relative_dates) else 'N/A'
+        absolute_date = convert_relative_time(relative_date) if relative_date != 'N/A' else 'N/A'
+
+        # Append data with the new Date column
+        data.append((
+            review['author'],
+            review['url'],
+            review['description'],
+            review['reviewRating']['ratingValue'],
+            absolute_date  # New Date column with converted absolute date
+        ))
+    return data
+
+
 def clean_reviews(html_text):
     """Cleans and collects the reviews from the HTML"""
     try:
         reviews = html_text.find_all('script', type='application/ld+json')[1]
         reviews = json.loads(reviews.string)['reviews']
-        data = []
-        review_date_tags = html_text.find_all('p', class_='sc-1hez2tp-0 fKvqMN time-stamp')
-
-        for i, review in enumerate(reviews):
-            # Extract the relative date from the <p> tag
-            relative_date = review_date_tags[i].get_text(strip=True) if i < len(review_date_tags) else 'N/A'
-            absolute_date = convert_relative_time(relative_date) if relative_date != 'N/A' else 'N/A'
-
-            # Append data with the new Date column
-            data.append((
-                review['author'],
-                review['url'],
-                review['description'],
-                review['reviewRating']['ratingValue'],
-                absolute_date  # New Date column with converted absolute date
-            ))
-        return data
+        review_date_tags = html_text.find_all('p', class_=TIME_STAMP_CLASS)
+        return build_review_rows(reviews, [tag.get_text(strip=True) for tag in review_date_tags])
     except (IndexError, KeyError) as e:
         print(f"Error extracting reviews: {e}")
         return []
 
 
-def save_df(file_name, df, restaurant_url, sort_order, num_reviews):
+def tag_text(inner_html):
+    """Returns the text of a tag like BeautifulSoup's get_text(strip=True)"""
+    pieces = (html.unescape(piece).strip() for piece in tag_pattern.split(inner_html))
+    return ''.join(piece for piece in pieces if piece)
+
+
+def clean_reviews_fast(page_text):
+    """Collects the reviews by scanning the page for the ld+json scripts and time-stamp tags,
+    without building a tree. Returns None when the page does not look as expected."""
+    scripts = ld_json_pattern.findall(page_text)
+    if len(scripts) < 2:
+        return None
+
+    try:
+        reviews = json.loads(scripts[1])['reviews']
+        relative_dates = [tag_text(inner_html) for inner_html in time_stamp_pattern.findall(page_text)]
+        if len(relative_dates) < len(reviews):
+            return None  # Let the full parse decide which dates are really missing
+        return build_review_rows(reviews, relative_dates)
+    except (ValueError, KeyError, TypeError):
+        return None
+
+
+def parse_reviews(page_text):
+    """Collects the reviews of a page, building the full BeautifulSoup tree only if the fast scan fails"""
+    data = clean_reviews_fast(page_text)
+    if data is None:
+        data = clean_reviews(BeautifulSoup(page_text, 'lxml'))
+    return data
+
+
+def check_parser_parity(cache):
+    """Parses every cached page with both the fast scan and the full tree and reports any differences"""
+    checked, fast_parsed, mismatches = 0, 0, []
+    fast_time, full_time = 0.0, 0.0
+
+    for link, page_text in cache.pages():
+        start = time.perf_counter()
+        fast = clean_reviews_fast(page_text)
+        fast_time += time.perf_counter() - start
+
+        start = time.perf_counter()
+        full = clean_reviews(BeautifulSoup(page_text, 'lxml'))
+        full_time += time.perf_counter() - start
+
+        checked += 1
+        if fast is not None:
+            fast_parsed += 1
+            if fast != full:
+                mismatches.append(link)
+                print(f"Mismatch: {link}")
+
+    print(f"{checked} pages checked, {fast_parsed} parsed by the fast scan, {len(mismatches)} mismatches.")
+    if checked:
+        print(f"Fast scan: {fast_time / checked * 1000:.2f} ms/page, full tree: {full_time / checked * 1000:.2f} ms/page")
+    return mismatches
+
+
+def review_file_path(file_name, sort_order, num_reviews, directory="Reviews", file_format=None):
+    """Return the path of the review file for the restaurant, sorting and review count"""
+    return table_path(f"{directory}/{file_name}_{sort_order}_{num_reviews}_reviews", file_format)
+
+
+def review_metadata(restaurant_url, sort_order, num_reviews):
+    """Run details kept with a review file (only the URL survives in CSV files)"""
+    return {'url': restaurant_url, 'sort': sort_order, 'reviews': num_reviews,
+            'scraped_at': datetime.now().isoformat(timespec='seconds')}
+
+
+def typed_review_chunks(chunks):
+    """Give every chunk of review rows the same column types, so they all fit one Parquet schema"""
+    for chunk in chunks:
+        chunk = chunk.astype({'Author': 'string', 'Review URL': 'string', 'Description': 'string', 'Date': 'string'})
+        chunk['Rating'] = pd.to_numeric(chunk['Rating'], errors='coerce').astype('float64')
+        yield chunk
+
+
+def save_df(file_name, df, restaurant_url, sort_order, num_reviews, file_format=None):
     """Save the DataFrame with better filepathing and avoid blank rows"""
     directory = "Reviews"
 
@@ -87,22 +201,267 @@ def save_df(file_name, df, restaurant_url, sort_order, num_reviews):
         os.makedirs(directory)
 
     # Create the file name with sorting and review count
-    file_name = f"{file_name}_{sort_order}_{num_reviews}_reviews.csv"
+    file_path = review_file_path(file_name, sort_order, num_reviews, directory, file_format)
+
+    # CSV files get the restaurant URL as their first line, Parquet files keep it in their metadata
+    if table_format(file_path) == 'parquet':
+        df = next(typed_review_chunks([df]))
+    write_table(file_path, df, review_metadata(restaurant_url, sort_order, num_reviews))
+
+    print(f"File saved as: {file_path}")
+    return file_path
+
+
+def finish_partial_file(rows_path, saved_path, file_path, metadata):
+    """Turn the partial file of a finished scrape into its review file, without loading all the rows.
+    The rows of the previously saved file, if any, are appended after the new ones and that file is removed.
+    CSV files are joined byte for byte, other formats are rewritten a chunk of rows at a time."""
+    if table_format(file_path) == 'csv' and (not saved_path or table_format(saved_path) == 'csv'):
+        if saved_path:
+            with open(rows_path, "ab") as file, open(saved_path, "rb") as saved:
+                saved.readline()  # Restaurant URL
+                saved.readline()  # Column names
+                shutil.copyfileobj(saved, file)
+        os.replace(rows_path, file_path)
+    else:
+        chunks = iter_table_chunks(rows_path)
+        if saved_path:
+            chunks = itertools.chain(chunks, iter_table_chunks(saved_path))
+        if table_format(file_path) == 'parquet':
+            chunks = typed_review_chunks(chunks)
+        write_table(file_path, chunks, metadata)
+        os.remove(rows_path)
+
+    if saved_path and os.path.abspath(saved_path) != os.path.abspath(file_path) and os.path.exists(saved_path):
+        os.remove(saved_path)  # The review count in the file name has changed
+    return file_path
+
+
+def find_saved_reviews(restaurant_name, sort_order, directory="Reviews"):
+    """Return the path of the most recently saved review file for the restaurant and sort order, or None"""
+    if not os.path.exists(directory):
+        return None
+
+    pattern = re.compile(rf"{re.escape(restaurant_name)}_{sort_order}_\d+_reviews(\.csv|\.parquet)")
+    paths = [os.path.join(directory, f) for f in os.listdir(directory) if pattern.fullmatch(f)]
+    return max(paths, key=os.path.getmtime) if paths else None
+
+
+def load_saved_reviews(file_path):
+    """Load a review file written by save_df, in any format"""
+    return read_table(file_path)[0]
 
-    # Open the file and write the restaurant URL as the first line
-    with open(f"{directory}/{file_name}", "w", encoding="utf-8", newline='') as file:
-        file.write(f"{restaurant_url}\n")  # Add restaurant URL at the top
-        # Write the DataFrame to CSV without adding extra blank lines
-        df.to_csv(file, index=False, header=True)  # header=True ensures column names are written
 
-    print(f"File saved as: {directory}/{file_name}")
+def count_saved_reviews(file_path):
+    """Count the reviews of a review file, reading one column a chunk at a time"""
+    chunks = pd.read_csv(file_path, skiprows=1, usecols=['Review URL'], chunksize=10000)
+    return sum(len(chunk) for chunk in chunks)
 
 
-def get_reviews(url, max_reviews, sort='popular', save=True):
-    """Get all reviews from the passed URL"""
+def checkpoint_paths(restaurant_name, sort_order, directory=os.path.join("Reviews", ".partial")):
+    """Return the partial review file and the cursor file of a scrape job"""
+    base = os.path.join(directory, f"{restaurant_name}_{sort_order}")
+    return f"{base}.csv", f"{base}.json"
+
+
+def load_checkpoint(url, rows_path, cursor_path):
+    """Return the cursor of an unfinished scrape of the URL, or None.
+    Rows written to the partial file after the cursor was last saved are dropped."""
+    try:
+        with open(cursor_path, encoding="utf-8") as file:
+            cursor = json.load(file)
+    except (OSError, ValueError):
+        return None
+
+    if cursor.get('url') != url or not os.path.exists(rows_path):
+        return None
+
+    with open(rows_path, "r+b") as file:
+        file.truncate(cursor['size'])
+    return cursor
+
+
+def save_checkpoint(url, rows_path, cursor_path, page, data):
+    """Append a page of rows to the partial file, then move the cursor past that page"""
+    os.makedirs(os.path.dirname(rows_path), exist_ok=True)
+    new_file = not os.path.exists(rows_path)
+    with open(rows_path, "a", encoding="utf-8", newline='') as file:
+        if new_file:
+            file.write(f"{url}\n")  # Same layout as the files written by save_df
+        pd.DataFrame(data, columns=REVIEW_COLUMNS).to_csv(file, index=False, header=new_file)
+
+    cursor = {'url': url, 'page': page, 'size': os.path.getsize(rows_path), 'last_page': data}
+    temp_path = f"{cursor_path}.tmp"
+    with open(temp_path, "w", encoding="utf-8") as file:
+        json.dump(cursor, file)
+    os.replace(temp_path, cursor_path)  # The cursor only ever points at fully written pages
+
+
+def clear_checkpoint(rows_path, cursor_path):
+    """Delete the partial file and the cursor of a finished scrape job"""
+    for path in (rows_path, cursor_path):
+        if os.path.exists(path):
+            os.remove(path)
+
+
+def create_session(pool_size=1):
+    """Create a keep-alive session with a connection pool large enough for the given number of workers"""
+    session = requests.Session()
+    adapter = HTTPAdapter(pool_connections=pool_size, pool_maxsize=pool_size)
+    session.mount('https://', adapter)
+    session.mount('http://', adapter)
+    return session
+
+
+def get_host_slot(link, max_per_host):
+    """Return the semaphore capping concurrent requests to the host of the link.
+    Scrapes that use the same cap on the same host share their slots."""
+    key = (urlsplit(link).netloc, max_per_host)
+    with host_slots_lock:
+        if key not in host_slots:
+            host_slots[key] = threading.BoundedSemaphore(max_per_host)
+        return host_slots[key]
+
+
+def send_request(session, link, max_per_host=None):
+    """Send a single request, holding a per-host slot while it is in flight"""
+    if max_per_host:
+        with get_host_slot(link, max_per_host):
+            return session.get(link, headers=headers, timeout=10)  # 10 seconds timeout
+    return session.get(link, headers=headers, timeout=10)  # 10 seconds timeout
+
+
+def fetch_page(session, link, max_per_host=None, limiter=None, cache=None, offline=False, retry=None, refresh=False,
+               stop=None):
+    """Fetch the text of a single review page.
+    Timeouts, dropped connections, 429 and 5xx responses are retried with the retry policy's backoff,
+    and 429/503 responses also slow the limiter down. Pages found in the cache are returned
+    without a request, and offline only reads the cache, returning None for pages that are not cached.
+    With refresh=True the cache is only written to, so pages whose content moves are always fetched fresh.
+    Once the stop event is set, a page that has not been requested yet returns None without a request."""
+    if cache and (offline or not refresh):
+        page_text = cache.get(link, ignore_ttl=offline)
+        if page_text is not None or offline:
+            return page_text
+
+    retry = retry or default_retry
+    wait = stop.wait if stop else time.sleep  # Backoffs end early once stopped
+    for attempt in range(retry.retries + 1):
+        if limiter:
+            limiter.acquire(link)  # Wait for the rate limits before taking a slot
+        if stop and stop.is_set():
+            return None
+        try:
+            webpage = send_request(session, link, max_per_host)
+        except (Timeout, requests.ConnectionError):
+            if attempt == retry.retries:
+                raise
+            wait(retry.delay(attempt))
+            continue
+
+        if webpage.status_code in THROTTLE_STATUSES and limiter:
+            limiter.throttled(link)
+        if webpage.status_code in RETRY_STATUSES and attempt < retry.retries:
+            wait(retry.delay(attempt, parse_retry_after(webpage.headers.get('Retry-After'))))
+            continue
+        break
+
+    webpage.raise_for_status()  # Raise exception for bad status codes
+    if limiter:
+        limiter.succeeded(link)
+
+    if cache:
+        cache.put(link, webpage.text)
+    return webpage.text
+
+
+def fetch_pages(session, links, workers=1, max_per_host=None, limiter=None, cache=None, offline=False, retry=None,
+                first_page=1, refresh=False):
+    """Fetch pages with up to `workers` requests in flight and yield (page, text, error) in page order.
+    Closing the generator stops every request that has not been sent yet."""
+    if workers <= 1:
+        for page, link in enumerate(links, start=first_page):
+            try:
+                yield page, fetch_page(session, link, max_per_host, limiter, cache, offline, retry, refresh), None
+            except RequestException as e:
+                yield page, None, e
+        return
+
+    executor = ThreadPoolExecutor(max_workers=workers)
+    stop = threading.Event()
+    pending = deque()
+    links = enumerate(links, start=first_page)
+
+    def submit(link):
+        return executor.submit(fetch_page, session, link, max_per_host, limiter, cache, offline, retry, refresh, stop)
+
+    try:
+        # Keep `workers` pages in flight. The next page is only submitted once the oldest one is done, so
+        # `workers` pages are pending ahead of the page being consumed and none queues without a thread
+        for page, link in links:
+            pending.append((page, submit(link)))
+            if len(pending) >= workers:
+                break
+
+        while pending:
+            page, future = pending.popleft()
+            try:
+                fetched = page, future.result(), None
+            except RequestException as e:
+                fetched = page, None, e
+            next_link = next(links, None)
+            if next_link is not None:
+                pending.append((next_link[0], submit(next_link[1])))
+            yield fetched
+    finally:
+        # Requests already sent finish in the background, the rest return without sending
+        stop.set()
+        for _, future in pending:
+            future.cancel()
+        executor.shutdown(wait=False, cancel_futures=True)
+
+
+def get_reviews(url, max_reviews, sort='popular', save=True, workers=1, max_per_host=None, session=None, limiter=None,
+                incremental=False, cache=None, offline=False, retry=None, resume=True, as_frame=False, file_format=None):
+    """Get all reviews from the passed URL.
+    With workers > 1 the pages are fetched concurrently over a shared keep-alive session,
+    with at most max_per_host requests in flight per host, and still processed in page order.
+    With incremental=True the newest reviews are fetched only until one already saved in Reviews/
+    is reached, and the new ones are merged into the saved file.
+    Raw pages are kept in the given PageCache, and offline=True re-parses the cached pages
+    without any network traffic (a ValueError is raised if there is no cache). Pages of the
+    new sort are always fetched, as new reviews move them, and only written to the cache.
+    Failed requests are retried following the retry policy, and the limiter adapts its rate
+    to the 429/503 responses of the site.
+    Saved scrapes stream every page to a partial file under Reviews/.partial, which is renamed
+    to the review file at the end, so memory use does not grow with the number of reviews.
+    The partial file is also a checkpoint: with resume=True a scrape of the same URL and sort
+    that was interrupted carries on from its last completed page.
+    The review file is written in file_format ('csv' or 'parquet', the storage default if None).
+    Returns the reviews when save is False. Otherwise returns a summary of the saved file,
+    or the reviews loaded back from it if as_frame is set."""
 
     global headers
 
+    if offline and cache is None:
+        raise ValueError("offline scrapes need a page cache to read the pages from")
+
+    # Extracting the restaurant name from the URL
+    restaurant_name = url.split("/")[-1].replace("-", "_")
+
+    # Incremental scrapes walk the newest reviews until they reach the ones already saved
+    saved_path = None
+    saved_reviews = 0
+    known_urls = set()
+    if incremental:
+        sort = 'new'
+        saved_path = find_saved_reviews(restaurant_name, sort)
+        if saved_path:
+            saved_urls = read_table(saved_path, columns=['Review URL'])[0]['Review URL']
+            saved_reviews = len(saved_urls)
+            known_urls = set(saved_urls)
+            print(f"Found {saved_reviews} saved reviews in {saved_path}")
+
     # Setting variables for the scraping
     max_reviews = max_reviews // 5  # Convert to number of pages (5 reviews per page)
     sort_order = 'popular' if sort == 'popular' else 'new'
@@ -111,63 +470,209 @@ def get_reviews(url, max_reviews, sort='popular', save=True):
     elif sort == 'new':
         sort = '&sort=dd'
 
-    reviews = []
+    reviews = []  # Only used when the reviews are not saved
+    num_reviews = 0
     prev_data = None
+    first_page = 1
+
+    # Saved scrapes stream every page to the partial file, which doubles as their checkpoint.
+    # Offline rebuilds never resume and write their own partial file, leaving the checkpoint of an online scrape alone.
+    rows_path, cursor_path = checkpoint_paths(restaurant_name, f"{sort_order}_offline" if offline else sort_order)
+    cursor = load_checkpoint(url, rows_path, cursor_path) if save and resume and not offline else None
+    if cursor:
+        num_reviews = count_saved_reviews(rows_path)
+        prev_data = [tuple(review) for review in cursor['last_page']]
+        first_page = cursor['page'] + 1
+        print(f"Resuming from page {first_page} with {num_reviews} reviews already scraped.")
+    elif save:
+        clear_checkpoint(rows_path, cursor_path)
 
     print("Scraping...")  # Show scraping message
 
+    own_session = session is None
+    if own_session:
+        session = create_session(max(workers, 1))
+    if limiter is None:
+        limiter = RateLimiter()
+
     # Collecting the reviews
     try:
-        for i in range(1, max_reviews + 1):  # +1 to ensure the correct number of pages
-            link = url + f"/reviews?page={i}{sort}"
-            try:
-                webpage = requests.get(link, headers=headers, timeout=10)  # 10 seconds timeout
-                webpage.raise_for_status()  # Raise exception for bad status codes
-
-            except Timeout:
-                print(f"Request timed out for page {i}. Skipping this page...")
-                continue  # Skip to the next page
-
-            except RequestException as e:
-                print(f"Error occurred while making a request: {e}")
-                return pd.DataFrame()  # Return an empty DataFrame on request failure
-
-            html_text = BeautifulSoup(webpage.text, 'lxml')
-            data = clean_reviews(html_text)
-
-            if not data:  # If no reviews were extracted, stop scraping
-                print("No more reviews found or an error occurred.")
-                break
-
-            if prev_data == data:  # If the same reviews are being fetched, stop
-                print("Duplicate reviews found. Stopping...")
-                break
-
-            reviews.extend(data)
-            prev_data = data
-
-        if not reviews:
+        links = (url + f"/reviews?page={i}{sort}" for i in range(first_page, max_reviews + 1))  # +1 to ensure the correct number of pages
+        # The newest reviews shift down the pages of the new sort, so its pages are never read back from the cache
+        pages = fetch_pages(session, links, workers, max_per_host, limiter, cache, offline, retry, first_page,
+                            refresh=sort_order == 'new')
+        try:
+            for i, page_text, error in pages:
+                if isinstance(error, Timeout):
+                    print(f"Request timed out for page {i} after every retry. Skipping this page...")
+                    continue  # Skip to the next page
+
+                if error is not None:
+                    print(f"Error occurred while making a request: {error}")
+                    print(f"Stopping and keeping the {num_reviews} reviews collected so far.")
+                    break
+
+                if page_text is None:  # Only happens offline
+                    print(f"Page {i} is not in the cache. Stopping...")
+                    break
+
+                data = parse_reviews(page_text)
+
+                if not data:  # If no reviews were extracted, stop scraping
+                    print("No more reviews found or an error occurred.")
+                    break
+
+                if prev_data == data:  # If the same reviews are being fetched, stop
+                    print("Duplicate reviews found. Stopping...")
+                    break
+
+                # Keep only the reviews newer than the first one already saved
+                seen_at = next((k for k, review in enumerate(data) if review[1] in known_urls), None)
+                if seen_at is not None:
+                    data = data[:seen_at]
+                    print("Reached reviews that are already saved. Stopping...")
+
+                num_reviews += len(data)
+                if save:
+                    save_checkpoint(url, rows_path, cursor_path, i, data)
+                else:
+                    reviews.extend(data)
+
+                if seen_at is not None:
+                    break
+                prev_data = data
+        finally:
+            pages.close()  # Cancel the requests still queued after a stop condition
+            if own_session:
+                session.close()
+
+        if not save:
+            return pd.DataFrame(reviews, columns=REVIEW_COLUMNS) if reviews else pd.DataFrame()
+
+        if num_reviews == 0:
+            clear_checkpoint(rows_path, cursor_path)
+            if saved_path:
+                print("No new reviews since the last scrape.")
+                return scrape_summary(saved_path, saved_reviews, 0, as_frame)
             print("No reviews were scraped.")
-            return pd.DataFrame()  # Return empty DataFrame if no reviews were found
+            return scrape_summary(None, 0, 0, as_frame)
 
-        # Extracting the restaurant name from the URL
-        restaurant_name = url.split("/")[-1].replace("-", "_")
+        # Put the new reviews on top of the saved ones, newest first
+        total_reviews = num_reviews + saved_reviews
+        if saved_path:
+            print(f"Merging {num_reviews} new reviews into {saved_path}")
+        file_path = review_file_path(restaurant_name, sort_order, total_reviews, file_format=file_format)
+        saved_to = finish_partial_file(rows_path, saved_path, file_path, review_metadata(url, sort_order, total_reviews))
+        clear_checkpoint(rows_path, cursor_path)
+        print(f"File saved as: {saved_to}")
 
-        columns = ['Author', 'Review URL', 'Description', 'Rating', 'Date']
-        review_df = pd.DataFrame(reviews, columns=columns)
-
-        # Save reviews in CSV file with restaurant URL and other details
-        if save:
-            save_df(restaurant_name, review_df, url, sort_order, len(reviews))
-
-        return review_df
+        return scrape_summary(saved_to, total_reviews, num_reviews, as_frame)
 
     except Exception as e:
         print(f"An error occurred during scraping: {e}")
-        return pd.DataFrame()  # Return empty DataFrame on general failure
+        return scrape_summary(None, 0, 0, as_frame) if save else pd.DataFrame()
+
+
+def scrape_summary(path, num_reviews, new_reviews, as_frame=False):
+    """Describe a saved scrape, or load its reviews from disk if as_frame is set"""
+    if as_frame:
+        return load_saved_reviews(path) if path else pd.DataFrame()
+    return {'path': path, 'reviews': num_reviews, 'new_reviews': new_reviews}
+
+
+async def scrape_restaurant(url, max_reviews, sort, executor, session, restaurant_slots, limiter, workers, max_per_host,
+                            incremental, cache, offline, retry, resume, file_format):
+    """Scrape one restaurant on the shared executor once a restaurant slot is free"""
+    async with restaurant_slots:
+        loop = asyncio.get_running_loop()
+        scrape = functools.partial(get_reviews, url, max_reviews, sort, save=True, workers=workers,
+                                   max_per_host=max_per_host, session=session, limiter=limiter, incremental=incremental,
+                                   cache=cache, offline=offline, retry=retry, resume=resume, file_format=file_format)
+        summary = await loop.run_in_executor(executor, scrape)
+        return url, summary['reviews']
+
+
+async def scrape_all(urls, max_reviews, sort='popular', concurrency=10, workers=1, max_per_host=4, rate=None, per_host_rate=None,
+                     incremental=False, cache=None, offline=False, retry=None, resume=True, file_format=None):
+    """Scrape every restaurant in urls on one event loop and one connection pool.
+    Up to `concurrency` restaurants run at once, so a slow restaurant only ever holds its own slot,
+    while max_per_host, rate and per_host_rate cap the requests of all restaurants together."""
+    session = create_session(concurrency * max(workers, 1))
+    limiter = RateLimiter(rate, per_host_rate)
+    restaurant_slots = asyncio.Semaphore(concurrency)
+    results = {}
 
-
-if __name__ == "__main__":
+    try:
+        with ThreadPoolExecutor(max_workers=concurrency) as executor:
+            tasks = [asyncio.create_task(scrape_restaurant(url, max_reviews, sort, executor, session, restaurant_slots,
+                                                           limiter, workers, max_per_host, incremental, cache, offline,
+                                                           retry, resume, file_format))
+                     for url in urls]
+            for done, task in enumerate(asyncio.as_completed(tasks), start=1):
+                url, num_reviews = await task
+                results[url] = num_reviews
+                print(f"[{done}/{len(tasks)}] {num_reviews} reviews scraped from {url}")
+    finally:
+        session.close()
+
+    return results
+
+
+def scrape_many(urls, max_reviews, sort='popular', **options):
+    """Scrape a list of restaurant URLs at once and return the number of reviews scraped per URL"""
+    return asyncio.run(scrape_all(urls, max_reviews, sort, **options))
+
+
+def read_url_list(file_path):
+    """Read restaurant URLs from a file, one per line, skipping blank lines and # comments"""
+    with open(file_path, encoding="utf-8") as file:
+        lines = (line.strip() for line in file)
+        return [line for line in lines if line and not line.startswith('#')]
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="Scrape Zomato reviews for many restaurants at once.")
+    parser.add_argument('urls', nargs='*', help="restaurant URLs to scrape")
+    parser.add_argument('--url-file', help="file with one restaurant URL per line")
+    parser.add_argument('--max-reviews', type=int, default=50, help="number of reviews to scrape per restaurant")
+    parser.add_argument('--sort', choices=['new', 'popular'], default='popular')
+    parser.add_argument('--concurrency', type=int, default=10, help="restaurants scraped at once")
+    parser.add_argument('--workers', type=int, default=1, help="pages fetched in parallel per restaurant")
+    parser.add_argument('--max-per-host', type=int, default=4, help="requests in flight per host")
+    parser.add_argument('--rate', type=float, help="requests per second across all restaurants")
+    parser.add_argument('--per-host-rate', type=float, help="requests per second per host")
+    parser.add_argument('--retries', type=int, default=4, help="retries of a failed page request")
+    parser.add_argument('--restart', action='store_true', help="ignore the checkpoints of interrupted scrapes")
+    parser.add_argument('--incremental', action='store_true',
+                        help="only fetch the reviews newer than the ones already saved in Reviews/")
+    parser.add_argument('--cache-dir', help="keep the raw pages in this directory")
+    parser.add_argument('--cache-ttl', type=float, default=168, help="hours before a cached page is fetched again")
+    parser.add_argument('--cache-size', type=float, default=500, help="megabytes the page cache may use")
+    parser.add_argument('--from-cache', action='store_true',
+                        help="rebuild the review files from the cached pages without any network traffic")
+    parser.add_argument('--format', choices=sorted(FORMATS), default=DEFAULT_FORMAT,
+                        help="storage format of the review files (parquet needs pyarrow)")
+    parser.add_argument('--check-parity', action='store_true',
+                        help="compare the fast and full-tree parsers on every cached page")
+    return parser.parse_args()
+
+
+if __name__ == "__main__" and len(sys.argv) > 1:
+    args = parse_args()
+    urls = args.urls + (read_url_list(args.url_file) if args.url_file else [])
+    if (args.from_cache or args.check_parity) and not args.cache_dir:
+        sys.exit("--from-cache and --check-parity need --cache-dir")
+    cache = PageCache(args.cache_dir, args.cache_ttl * 3600, int(args.cache_size * 1024 * 1024)) if args.cache_dir else None
+    if args.check_parity:
+        sys.exit(1 if check_parser_parity(cache) else 0)
+
+    results = scrape_many(urls, args.max_reviews, args.sort, concurrency=args.concurrency, workers=args.workers,
+                          max_per_host=args.max_per_host, rate=args.rate, per_host_rate=args.per_host_rate,
+                          incremental=args.incremental, cache=cache, offline=args.from_cache,
+                          retry=RetryPolicy(args.retries), resume=not args.restart, file_format=args.format)
+    print(f"Scraped {sum(results.values())} reviews from {sum(1 for n in results.values() if n)} of {len(urls)} restaurants.")
+
+elif __name__ == "__main__":
     # Get inputs from the user
     url = input("Enter the Zomato restaurant URL: ").strip()
 
@@ -184,10 +689,20 @@ if __name__ == "__main__":
         print("Invalid sorting option, defaulting to 'popular'.")
         sort = 'popular'
 
+    # Prompt user for the number of pages to fetch in parallel
+    try:
+        workers = int(input("Enter the number of pages to fetch in parallel (default is 1): ").strip() or 1)
+    except ValueError:
+        print("Invalid input, defaulting to 1 page at a time.")
+        workers = 1
+
+    # Prompt user for an incremental refresh of the saved reviews
+    incremental = sort == 'new' and input("Only fetch reviews newer than the saved ones? (y/n): ").strip().lower() == 'y'
+
     # Call the function with user inputs
-    reviews_df = get_reviews(url, max_reviews, sort)
+    summary = get_reviews(url, max_reviews, sort, workers=workers, max_per_host=workers, incremental=incremental)
 
-    if not reviews_df.empty:
-        print(f"Scraped {len(reviews_df)} reviews successfully!")
+    if summary['new_reviews']:
+        print(f"Scraped {summary['new_reviews']} reviews successfully!")
     else:
         print("No reviews were scraped.")